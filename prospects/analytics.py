@@ -0,0 +1,791 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from prospects.fake_es import filter_response, tokenize
+from prospects.mapping import ES_MAPPING
+from prospects.prospect import FIELDS
+from prospects.settings import ES_INDEX, ES_DOC_TYPE
+
+
+# In memory, columnar copy of the prospects that the query DSL
+# search.py uses can be run against, locally.
+#
+# Every field but the id is stored categorically: its distinct
+# values, sorted, and a code per row into them. A condition on a
+# field is evaluated once per distinct value, then spread to the
+# rows with a lookup on the codes, so a query over millions of rows
+# is a handful of vectorized array operations.
+
+PROPERTIES = ES_MAPPING[ES_DOC_TYPE]['properties']
+
+
+def field_kind(field):
+    """
+    How a field is indexed: keyword, text, date, boolean or long
+    :param field
+    """
+
+    spec = PROPERTIES.get(field, {'type': 'string'})
+
+    if spec['type'] == 'string':
+        return 'keyword' if spec.get('index') == 'not_analyzed' else 'text'
+    if spec['type'] in ('integer', 'long', 'short'):
+        return 'long'
+
+    return spec['type']
+
+
+def date_millis(value):
+    """
+    A yyyy-mm-dd date as epoch milliseconds, how the cluster
+    keys date buckets
+    :param value
+    """
+
+    day = np.datetime64(value[:10], 'D')
+    return int(day.astype('datetime64[ms]').astype(np.int64))
+
+
+def compact(codes, values):
+    """
+    Codes in the smallest int type that holds them, a byte a row
+    for most fields
+    :param codes
+    :param values: the values coded
+    """
+
+    return codes.astype(np.min_scalar_type(max(len(values) - 1, 0)))
+
+
+class ProspectFrame(object):
+    """
+    Columnar snapshot of prospects, searched like the cluster
+
+        frame = ProspectFrame.from_index(es)
+        frame.search(**ACTIVE_PROSPECTS_SEARCH)['hits']['total']
+
+    search() and count() take the same arguments as es.search and
+    es.count, so the search.py requests can be run against either.
+    """
+
+    def __init__(self, ids, columns):
+        """
+        :param ids: int array of prospect ids
+        :param columns: dict of field -> (sorted distinct values, codes)
+        """
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.columns = columns
+        self.token_index = {}
+        self.id_column = None
+
+        # Hits tie on score a lot, the cluster stand-in breaks ties
+        # on the id as a string. Rows in that order, once.
+        self.by_id = np.argsort(self.ids.astype('S20'), kind='mergesort')
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_columns(cls, arrays):
+        """
+        Build from whole columns
+        :param arrays: dict of field -> sequence of values
+        """
+
+        columns = {}
+        for field, column in arrays.items():
+            if field == 'id':
+                continue
+
+            column = np.asarray(column)
+
+            # Strings sort far faster fixed width than as objects
+            if column.dtype.kind in 'OS' and None not in column:
+                column = column.astype(unicode)
+
+            values, codes = np.unique(column, return_inverse=True)
+            columns[field] = (values.astype(object), compact(codes, values))
+
+        return cls(arrays['id'], columns)
+
+    @classmethod
+    def from_sources(cls, sources):
+        """
+        Build from prospect sources
+        :param sources: iterable of source dicts
+        """
+
+        arrays = dict((field, []) for field in FIELDS)
+
+        for source in sources:
+            for field in FIELDS:
+                arrays[field].append(source.get(field))
+
+        return cls.from_columns(arrays)
+
+    @classmethod
+    def from_batches(cls, batches):
+        """
+        Build from generated ProspectBatches, without going through
+        a source per prospect
+        :param batches: iterable of ProspectBatch
+        """
+
+        batches = list(batches)
+
+        arrays = dict(
+            (field, np.concatenate([batch.columns[field] for batch in batches]))
+            for field in FIELDS
+        )
+
+        # Batches keep certificate ids as ints
+        values, codes = np.unique(arrays.pop('certificate_id'), return_inverse=True)
+        certificate_ids = np.array(['%06X' % v for v in values], dtype=object)
+
+        frame = cls.from_columns(arrays)
+        frame.columns['certificate_id'] = (certificate_ids, compact(codes, values))
+
+        return frame
+
+    @classmethod
+    def from_index(cls, es, index=ES_INDEX, query=None):
+        """
+        Snapshot the prospects in an index
+        :param es
+        :param index
+        :param query: only prospects matching this
+        """
+
+        from prospects.export import export_prospects
+
+        return cls.from_sources(export_prospects(es, index, query))
+
+    def save(self, path):
+        """
+        Save the snapshot, as a .npz file
+        :param path
+        """
+
+        arrays = {'id': self.ids}
+        for field, (values, codes) in self.columns.items():
+            arrays['%s.values' % field] = values
+            arrays['%s.codes' % field] = codes
+
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a snapshot saved with save()
+        :param path
+        """
+
+        data = np.load(path, allow_pickle=True)
+        columns = dict(
+            (field, (data['%s.values' % field], data['%s.codes' % field]))
+            for field in FIELDS if field != 'id'
+        )
+
+        return cls(data['id'], columns)
+
+    #
+    # Queries, each evaluates to a boolean mask over the rows
+    #
+
+    def where(self, field, predicate):
+        """
+        Rows whose field value meets a predicate, evaluated
+        once per distinct value
+        :param field
+        :param predicate: value -> bool
+        """
+
+        if field == 'id':
+            return np.fromiter(
+                (predicate(v) for v in self.ids), dtype=bool, count=len(self)
+            )
+
+        if field not in self.columns:
+            return np.zeros(len(self), dtype=bool)
+
+        values, codes = self.columns[field]
+        hits = np.fromiter(
+            (v is not None and predicate(v) for v in values),
+            dtype=bool, count=len(values)
+        )
+
+        # Most conditions pick one value, comparing codes is quicker
+        matched = np.flatnonzero(hits)
+        if len(matched) == 1:
+            return codes == matched[0]
+
+        return hits.take(codes)
+
+    def normalize(self, field, value):
+        """
+        Turn a query value into the type stored
+        :param field
+        :param value
+        """
+
+        kind = field_kind(field)
+
+        if kind == 'boolean':
+            if isinstance(value, basestring):
+                return value.lower() == 'true'
+            return bool(value)
+        if kind == 'long':
+            return int(value)
+
+        return unicode(value)
+
+    def mask(self, query):
+        """
+        Get the rows matching a query
+        :param query: query DSL dict
+        """
+
+        if not query:
+            return np.ones(len(self), dtype=bool)
+
+        (kind, spec), = query.items()
+
+        method = getattr(self, 'query_' + kind, None)
+        if method is None:
+            raise ValueError('No query registered for [%s]' % kind)
+
+        return method(spec)
+
+    def query_match_all(self, spec):
+        return np.ones(len(self), dtype=bool)
+
+    def query_match(self, spec):
+        (field, value), = spec.items()
+        if isinstance(value, dict):
+            value = value['query']
+
+        if field == '_all':
+            mask = np.zeros(len(self), dtype=bool)
+            for name in FIELDS:
+                mask |= self.query_match({name: value})
+            return mask
+
+        if field_kind(field) != 'text':
+            return self.query_term({field: value})
+
+        terms = set(tokenize(value))
+        return self.where(field, lambda v: bool(terms.intersection(tokenize(v))))
+
+    def query_match_phrase(self, spec):
+        (field, value), = spec.items()
+        if isinstance(value, dict):
+            value = value['query']
+
+        if field_kind(field) != 'text':
+            return self.query_match(spec)
+
+        phrase = tokenize(value)
+        n = len(phrase)
+
+        def contains(v):
+            tokens = tokenize(v)
+            return any(
+                tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1)
+            )
+
+        return self.where(field, contains)
+
+    def query_term(self, spec):
+        (field, value), = spec.items()
+        if isinstance(value, dict):
+            value = value.get('value', value.get('term'))
+
+        if field_kind(field) == 'text':
+            # Terms aren't analyzed, they have to be a whole token
+            return self.where(field, lambda v: value in tokenize(v))
+
+        try:
+            value = self.normalize(field, value)
+        except ValueError:
+            return np.zeros(len(self), dtype=bool)
+
+        if field == 'id':
+            return self.ids == value
+
+        return self.where(field, lambda v: v == value)
+
+    def query_terms(self, spec):
+        mask = np.zeros(len(self), dtype=bool)
+
+        for field, values in spec.items():
+            if field in ('execution', 'minimum_should_match', '_cache'):
+                continue
+
+            for value in values:
+                mask |= self.query_term({field: value})
+
+        return mask
+
+    def query_range(self, spec):
+        (field, bounds), = spec.items()
+
+        lower = bounds.get('gte', bounds.get('gt', bounds.get('from')))
+        upper = bounds.get('lte', bounds.get('lt', bounds.get('to')))
+        include_lower = 'gt' not in bounds and bounds.get('include_lower', True)
+        include_upper = 'lt' not in bounds and bounds.get('include_upper', True)
+
+        if lower is not None:
+            lower = self.normalize(field, lower)
+        if upper is not None:
+            upper = self.normalize(field, upper)
+
+        def within(v):
+            if lower is not None and (v < lower or (v == lower and not include_lower)):
+                return False
+            if upper is not None and (v > upper or (v == upper and not include_upper)):
+                return False
+            return True
+
+        if field == 'id':
+            mask = np.ones(len(self), dtype=bool)
+            if lower is not None:
+                mask &= self.ids >= lower if include_lower else self.ids > lower
+            if upper is not None:
+                mask &= self.ids <= upper if include_upper else self.ids < upper
+            return mask
+
+        return self.where(field, within)
+
+    def query_exists(self, spec):
+        return self.where(spec['field'], lambda v: True)
+
+    def query_bool(self, spec):
+        def clauses(key):
+            value = spec.get(key) or []
+            return value if isinstance(value, list) else [value]
+
+        must = clauses('must') + clauses('filter')
+        should = clauses('should')
+        must_not = clauses('must_not')
+
+        mask = None
+        for clause in must:
+            matched = self.mask(clause)
+            mask = matched if mask is None else mask & matched
+
+        if should:
+            matched = np.zeros(len(self), dtype=bool)
+            for clause in should:
+                matched |= self.mask(clause)
+
+            # Without a must, at least one should has to match
+            if mask is None:
+                mask = matched
+            elif spec.get('minimum_should_match'):
+                mask &= matched
+
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+
+        for clause in must_not:
+            mask &= ~self.mask(clause)
+
+        return mask
+
+    def query_filtered(self, spec):
+        mask = self.mask(spec.get('query'))
+        if spec.get('filter'):
+            mask &= self.mask(spec['filter'])
+
+        return mask
+
+    def query_constant_score(self, spec):
+        return self.mask(spec.get('filter') or spec.get('query'))
+
+    # ES 1.x filter names
+
+    def query_and(self, spec):
+        return self.query_bool({'must': spec})
+
+    def query_or(self, spec):
+        return self.query_bool({'should': spec})
+
+    def query_not(self, spec):
+        return self.query_bool({'must_not': [spec]})
+
+    def query_query_string(self, spec):
+        return self.lucene(spec['query'])
+
+    def lucene(self, q):
+        """
+        Just the field:value form of the Lucene syntax
+        :param q
+        """
+
+        if ':' not in q:
+            return self.query_match({'_all': q})
+
+        field, value = q.split(':', 1)
+        return self.query_match({field: value})
+
+    def should_clauses(self, query):
+        """
+        The clauses a query scores on. The cluster stand-in ranks
+        bool queries on the number of should clauses matched,
+        everything else scores the same.
+        :param query
+        """
+
+        while query and 'filtered' in query:
+            query = query['filtered'].get('query')
+
+        if not query or 'bool' not in query:
+            return []
+
+        should = query['bool'].get('should') or []
+        return should if isinstance(should, list) else [should]
+
+    #
+    # Aggregations
+    #
+
+    def bucket_key(self, field, value):
+        kind = field_kind(field)
+
+        if kind == 'boolean':
+            return {'key': int(value), 'key_as_string': str(value).lower()}
+        if kind == 'date':
+            return {'key': date_millis(value), 'key_as_string': value}
+
+        return {'key': value}
+
+    def aggregate(self, aggs, mask):
+        """
+        Run aggregations over the rows in a mask
+        :param aggs: aggregations DSL dict
+        :param mask
+        """
+
+        results = {}
+
+        for name, spec in aggs.items():
+            if 'terms' in spec:
+                results[name] = self.terms_agg(
+                    spec['terms'], mask,
+                    spec.get('aggs') or spec.get('aggregations')
+                )
+            elif 'min' in spec or 'max' in spec or 'sum' in spec:
+                kind = [k for k in ('min', 'max', 'sum') if k in spec][0]
+                results[name] = self.metric_agg(kind, spec[kind]['field'], mask)
+            else:
+                raise ValueError('Could not find aggregator type in [%s]' % name)
+
+        return results
+
+    def metric_agg(self, kind, field, mask):
+        if field == 'id':
+            values = self.ids[mask]
+        else:
+            values, codes = self.columns[field]
+            values = values[codes[mask]]
+
+        if kind == 'sum':
+            return {'value': float(np.sum(values)) if len(values) else 0.0}
+        if not len(values):
+            return {'value': None}
+
+        value = values.min() if kind == 'min' else values.max()
+        if field_kind(field) == 'date':
+            return {'value': date_millis(value), 'value_as_string': value}
+
+        return {'value': value.item() if hasattr(value, 'item') else value}
+
+    def column(self, field):
+        """
+        A field's (sorted values, codes), ids included
+        :param field
+        """
+
+        if field != 'id':
+            return self.columns[field]
+
+        # Every id is its own value, made the first time it's asked for
+        if self.id_column is None:
+            self.id_column = np.unique(self.ids, return_inverse=True)
+
+        return self.id_column
+
+    def field_terms(self, field):
+        """
+        The terms a field is indexed as, its values or for text
+        fields their tokens, and which values hold each term
+        :param field
+        :return: (sorted terms, value codes, term codes) where each
+            (value code, term code) pair is a value holding a term
+        """
+
+        values = self.column(field)[0]
+
+        if field_kind(field) != 'text':
+            codes = np.arange(len(values))
+            return values, codes, codes
+
+        if field not in self.token_index:
+            pairs = [
+                (code, token)
+                for code, value in enumerate(values)
+                for token in set(tokenize(value))
+            ]
+            terms, term_codes = np.unique(
+                np.array([token for _, token in pairs], dtype=object),
+                return_inverse=True
+            )
+            value_codes = np.array([code for code, _ in pairs], dtype=np.intp)
+
+            self.token_index[field] = (terms, value_codes, term_codes)
+
+        return self.token_index[field]
+
+    def terms_agg(self, spec, mask, sub_aggs=None):
+        field = spec['field']
+        size = spec.get('size', 10)
+
+        values, codes = self.column(field)
+        terms, value_codes, term_codes = self.field_terms(field)
+
+        # A row counts once towards each term its value holds
+        value_counts = np.bincount(codes[mask], minlength=len(values))
+        counts = np.bincount(
+            term_codes, weights=value_counts[value_codes], minlength=len(terms)
+        ).astype(np.int64)
+
+        # By count, then by term, terms are already sorted
+        order = np.lexsort((np.arange(len(terms)), -counts))
+        order = order[counts[order] > 0]
+        shown = order[:size or None]
+
+        buckets = []
+        for code in shown:
+            bucket = self.bucket_key(field, terms[code])
+            bucket['doc_count'] = int(counts[code])
+
+            if sub_aggs:
+                holding = np.zeros(len(values), dtype=bool)
+                holding[value_codes[term_codes == code]] = True
+                bucket.update(self.aggregate(sub_aggs, mask & holding[codes]))
+
+            buckets.append(bucket)
+
+        return {
+            'doc_count_error_upper_bound': 0,
+            'sum_other_doc_count': int(counts[order[len(shown):]].sum()),
+            'buckets': buckets
+        }
+
+    #
+    # es.search style API
+    #
+
+    def source(self, row, includes=None, excludes=None):
+        """
+        Row's source, as the cluster has it
+        :param row
+        :param includes: only these fields
+        :param excludes: not these fields
+        """
+
+        source = {}
+        for field in FIELDS:
+            if includes and field not in includes:
+                continue
+            if excludes and field in excludes:
+                continue
+
+            if field == 'id':
+                source[field] = int(self.ids[row])
+            else:
+                values, codes = self.columns[field]
+                source[field] = values[codes[row]]
+
+        return source
+
+    def search(self, index=None, doc_type=None, body=None, q=None, size=None,
+               from_=0, _source_include=None, _source_exclude=None,
+               filter_path=None, **params):
+        """
+        Search the snapshot, see es.search. Totals and aggregations
+        are the cluster's, hits tied on score are ordered by id.
+        """
+
+        started = time.time()
+
+        body = json.loads(body) if isinstance(body, basestring) else body or {}
+        size = int(body.get('size', 10 if size is None else size))
+        from_ = int(body.get('from', from_ or 0))
+
+        query = body.get('query')
+        mask = self.lucene(q) if q else self.mask(query)
+
+        response = {
+            'took': 0,
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+        }
+
+        aggs = body.get('aggs') or body.get('aggregations')
+        if aggs:
+            response['aggregations'] = self.aggregate(aggs, mask)
+
+        # A top level filter (post_filter) doesn't affect the aggregations
+        post_filter = body.get('post_filter', body.get('filter'))
+        if post_filter:
+            mask &= self.mask(post_filter)
+
+        total = int(mask.sum())
+        hits = []
+
+        if size and total:
+            shown, scores = self.top_rows(query, mask, from_ + size)
+
+            for row, score in zip(shown[from_:], scores[from_:]):
+                hits.append({
+                    '_index': index or ES_INDEX,
+                    '_type': doc_type or ES_DOC_TYPE,
+                    '_id': unicode(self.ids[row]),
+                    '_score': float(score),
+                    '_source': self.source(
+                        row,
+                        _source_include and list(_source_include),
+                        _source_exclude and list(_source_exclude)
+                    ),
+                })
+
+        response['hits'] = {
+            'total': total,
+            'max_score': max([hit['_score'] for hit in hits] or [None]),
+            'hits': hits
+        }
+        response['took'] = int((time.time() - started) * 1000)
+
+        return filter_response(response, filter_path)
+
+    def top_rows(self, query, mask, n):
+        """
+        The first n matching rows, best scored first, then by id
+        :param query
+        :param mask: the rows matching
+        :param n
+        :return: (rows, their scores)
+        """
+
+        matching = mask[self.by_id]
+        should = self.should_clauses(query)
+
+        if not should:
+            rows = self.by_id[np.flatnonzero(matching)[:n]]
+            return rows, [1.0] * len(rows)
+
+        ranked = self.by_id[matching]
+        scores = np.ones(len(ranked))
+        for clause in should:
+            scores += self.mask(clause)[ranked]
+
+        rows, row_scores = [], []
+        for score in np.unique(scores)[::-1]:
+            taken = ranked[scores == score][:n - len(rows)]
+            rows.extend(taken)
+            row_scores.extend([score] * len(taken))
+
+            if len(rows) >= n:
+                break
+
+        return rows, row_scores
+
+    def count(self, index=None, doc_type=None, body=None, q=None, **params):
+        """
+        Count the matching prospects, see es.count
+        """
+
+        body = json.loads(body) if isinstance(body, basestring) else body or {}
+        mask = self.lucene(q) if q else self.mask(body.get('query'))
+
+        return {
+            'count': int(mask.sum()),
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0}
+        }
+
+    def msearch(self, body, index=None, doc_type=None, **params):
+        """
+        Run a batch of searches, see es.msearch
+        """
+
+        if isinstance(body, basestring):
+            lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            lines = list(body)
+
+        responses = []
+        for header, request in zip(lines[::2], lines[1::2]):
+            try:
+                responses.append(self.search(
+                    index=header.get('index', index),
+                    doc_type=header.get('type', doc_type),
+                    body=request
+                ))
+            except ValueError as e:
+                responses.append({'error': str(e)})
+
+        return {'responses': responses}
+
+
+if __name__ == "__main__":
+    """
+    Test Driver
+    """
+
+    from prospects.batch import generate_batches
+    from prospects import search
+
+    parser = argparse.ArgumentParser(description='Run search.py queries locally')
+    parser.add_argument(
+        '--count', type=int, default=1000000,
+        help='Prospects to generate'
+    )
+    parser.add_argument(
+        '--from-index', action='store_true',
+        help='Snapshot the prospects index instead'
+    )
+    args = parser.parse_args()
+
+    started = time.time()
+    if args.from_index:
+        from prospects.client import es
+        frame = ProspectFrame.from_index(es)
+    else:
+        frame = ProspectFrame.from_batches(
+            generate_batches(1000, 1000 + args.count, 100000)
+        )
+    print 'Built %d rows in %.1fs\n' % (len(frame), time.time() - started)
+
+    requests = [
+        ('All', search.ALL_PROSPECTS_SEARCH),
+        ('Active', search.ACTIVE_PROSPECTS_SEARCH),
+        ('3 Series', search.BMW_THREE_SERIES_SEARCH),
+        ('In May', search.ACTIVE_IN_DATE_RANGE_SEARCH),
+        ('Sold BMW In May', search.SOLD_BMW_IN_MAY_SEARCH),
+        ('Sold In May Aggregations', search.SOLD_IN_MAY_AGGREGATIONS_SEARCH),
+    ] + [
+        ('Prospect Search %d' % i, request)
+        for i, request in enumerate(search.PROSPECT_SEARCHES)
+    ]
+
+    for label, request in requests:
+        started = time.time()
+        response = frame.search(**request)
+        print '%-25s %8d  %.1fms' % (
+            label, response['hits']['total'], (time.time() - started) * 1000
+        )
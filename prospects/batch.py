@@ -0,0 +1,181 @@
+from itertools import izip
+
+import numpy as np
+
+from prospects.prospect import (
+    FIELDS, ProspectValues, get_fake, record_seed
+)
+from prospects import serializer
+from prospects.settings import (
+    FAKER_SEED, BATCH_NAME_POOL_SIZE
+)
+
+
+# Names and emails are the only fields faker has to make one
+# at a time, so a pool of them is made once and indexed into
+_name_pool = None
+
+
+def name_pool():
+    """
+    Get the shared (names, emails) pool, making it on first use
+    """
+
+    global _name_pool
+
+    if _name_pool is None:
+        fake = get_fake()
+        fake.seed(record_seed(0))
+
+        names, emails = [], []
+        for _ in range(BATCH_NAME_POOL_SIZE):
+            names.append(fake.name())
+            emails.append(fake.email())
+
+        _name_pool = (
+            np.array(names, dtype=object),
+            np.array(emails, dtype=object)
+        )
+
+    return _name_pool
+
+
+def _vocabulary(values):
+    return np.array(values, dtype=object)
+
+
+STATUSES = _vocabulary(ProspectValues.STATUSES)
+PROGRAMS = _vocabulary(ProspectValues.PROGRAMS)
+POSTAL_CODES = _vocabulary(ProspectValues.POSTAL_CODES)
+NEW_USED = _vocabulary(ProspectValues.NEW_USED)
+ASSIGNED_TO = _vocabulary(ProspectValues.ASSIGNED_TO)
+YEARS = _vocabulary(ProspectValues.YEARS)
+MAKES = _vocabulary(ProspectValues.MAKES)
+
+# All models in one array, each make owns a slice of it
+MODELS = _vocabulary([
+    model
+    for make in ProspectValues.MAKES
+    for model in ProspectValues.MODELS[make]
+])
+MODEL_COUNTS = np.array([
+    len(ProspectValues.MODELS[make])
+    for make in ProspectValues.MAKES
+])
+MODEL_OFFSETS = np.cumsum(MODEL_COUNTS) - MODEL_COUNTS
+
+PROSPECT_YEARS = np.array(
+    ['%s-01-01' % year for year in ProspectValues.PROSPECT_YEARS],
+    dtype='datetime64[D]'
+)
+
+
+class ProspectBatch(object):
+    """
+    A run of Prospects stored as columns, every field is drawn
+    for the whole batch at once
+    """
+
+    def __init__(self, start_id, columns):
+        self.start_id = start_id
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    @classmethod
+    def generate(cls, start_id, n):
+        """
+        Generate n Prospects with ids starting at start_id. The batch
+        depends only on FAKER_SEED, start_id and n.
+        :param start_id
+        :param n
+        """
+
+        rng = np.random.RandomState([FAKER_SEED, start_id])
+        names, emails = name_pool()
+
+        def codes(vocabulary):
+            return rng.randint(0, len(vocabulary), n)
+
+        def flags():
+            return rng.randint(0, 2, n).astype(bool)
+
+        person = codes(names)
+
+        make = codes(MAKES)
+        model = MODEL_OFFSETS[make] + (
+            rng.random_sample(n) * MODEL_COUNTS[make]
+        ).astype(np.intp)
+
+        dates = PROSPECT_YEARS[codes(PROSPECT_YEARS)] + rng.randint(0, 365, n)
+
+        columns = {
+            'id': np.arange(start_id, start_id + n),
+            'name': names[person],
+            'email_address': emails[person],
+            'postal_code': POSTAL_CODES[codes(POSTAL_CODES)],
+            'prospect_date': np.datetime_as_string(dates),
+            'status': STATUSES[codes(STATUSES)],
+            'program': PROGRAMS[codes(PROGRAMS)],
+            'new_used': NEW_USED[codes(NEW_USED)],
+            'assigned_to': ASSIGNED_TO[codes(ASSIGNED_TO)],
+            'year': YEARS[codes(YEARS)],
+            'make': MAKES[make],
+            'model': MODELS[model],
+            'certificate_id': rng.randint(0, 0x1000000, n),
+            'has_manual_offers': flags(),
+            'has_automated_offers': flags(),
+            'sold': flags(),
+        }
+
+        return cls(start_id, columns)
+
+    def iter_rows(self):
+        """
+        Iterate the batch as tuples of python values, in FIELDS order
+        """
+
+        columns = [self.columns[field].tolist() for field in FIELDS]
+        certificate_ids = FIELDS.index('certificate_id')
+        columns[certificate_ids] = [
+            '%06X' % c for c in columns[certificate_ids]
+        ]
+
+        return izip(*columns)
+
+    def iter_dicts(self):
+        """
+        Iterate the batch as Prospect.as_dict() style dicts
+        """
+
+        for row in self.iter_rows():
+            yield dict(zip(FIELDS, row))
+
+    def iter_ndjson(self):
+        """
+        Iterate the batch as newline terminated JSON documents
+        """
+
+        for _, source in self.iter_sources():
+            yield source + '\n'
+
+    def iter_sources(self):
+        """
+        Iterate the batch as (id, encoded source) pairs
+        """
+
+        for row in self.iter_rows():
+            yield row[0], serializer.dumps(dict(zip(FIELDS, row)))
+
+
+def generate_batches(start, stop, batch_size):
+    """
+    Generate ProspectBatches covering the given id range
+    :param start
+    :param stop
+    :param batch_size
+    """
+
+    for lo in range(start, stop, batch_size):
+        yield ProspectBatch.generate(lo, min(batch_size, stop - lo))
@@ -0,0 +1,216 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from itertools import chain
+
+from prospects.batch import generate_batches
+from prospects.bulk import bulk_index_sources
+from prospects.client import new_client
+from prospects.fake_es import FakeElasticsearch
+from prospects.mapping import (
+    create_index, begin_bulk_load, end_bulk_load
+)
+
+
+# Throughput may drop, and latency rise, this much against
+# the baseline before it counts as a regression
+REGRESSION_THRESHOLD = 0.10
+
+# Latency changes smaller than this are noise, whatever the ratio
+NOISE_FLOOR_MS = 0.5
+
+# Metrics where bigger is better
+THROUGHPUT_METRICS = ('docs_per_sec',)
+
+# Metrics where smaller is better, anything else is informational
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def add_arguments(parser):
+    """
+    Options shared by the benchmarks
+    :param parser: argparse.ArgumentParser
+    """
+
+    parser.add_argument(
+        '--hosts', nargs='*',
+        help='Cluster to benchmark against, the in process stand-in if not given'
+    )
+    parser.add_argument(
+        '--output',
+        help='Write the results to this JSON file'
+    )
+    parser.add_argument(
+        '--baseline',
+        help='Compare the results to this JSON file, exit 1 on a regression'
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=REGRESSION_THRESHOLD,
+        help='Allowed change against the baseline, as a fraction'
+    )
+
+
+def make_client(hosts=None):
+    """
+    A client for the given hosts, or the in process stand-in
+    :param hosts
+    """
+
+    if hosts:
+        return new_client(hosts)
+
+    return FakeElasticsearch()
+
+
+def load_fixture(es, index, count, start=1000):
+    """
+    Create the index and load it with count prospects
+    :param es
+    :param index
+    :param count
+    :param start: first prospect id
+    """
+
+    es.indices.delete(index=index, ignore=[400, 404])
+    create_index(es, index)
+
+    restore = begin_bulk_load(es, index)
+
+    batches = generate_batches(start, start + count, 10000)
+    sources = chain.from_iterable(batch.iter_sources() for batch in batches)
+    summary = bulk_index_sources(es, sources, index)
+
+    end_bulk_load(es, index, restore)
+
+    return summary
+
+
+@contextmanager
+def quiet():
+    """
+    Throw away stdout, the query functions print their responses
+    """
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def percentile(values, pct):
+    """
+    Nearest rank percentile
+    :param values: sorted list
+    :param pct: 0-100
+    """
+
+    if not values:
+        return None
+
+    rank = int(round(pct / 100.0 * (len(values) - 1)))
+    return values[rank]
+
+
+def timed(fn, *args, **kwargs):
+    """
+    Call fn, return (seconds taken, result)
+    """
+
+    started = time.time()
+    result = fn(*args, **kwargs)
+
+    return time.time() - started, result
+
+
+def write_results(path, name, results):
+    """
+    Save results as JSON
+    :param path
+    :param name: which benchmark
+    :param results: dict of case -> dict of metric -> value
+    """
+
+    with open(path, 'w') as f:
+        json.dump({
+            'benchmark': name,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results
+        }, f, indent=2, sort_keys=True)
+
+
+def compare_results(results, path, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare results with a saved baseline
+    :param results: dict of case -> dict of metric -> value
+    :param path: baseline JSON file
+    :param threshold: allowed change, as a fraction
+    :return: list of (case, metric, baseline, current, change)
+        for every regression
+    """
+
+    with open(path) as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+
+    for case, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            before = baseline.get(case, {}).get(metric)
+            if not before or value is None:
+                continue
+
+            change = (value - before) / float(before)
+
+            if metric in THROUGHPUT_METRICS:
+                regressed = change < -threshold
+            elif metric in LATENCY_METRICS:
+                regressed = (change > threshold and
+                             value - before > NOISE_FLOOR_MS)
+            else:
+                regressed = False
+
+            if regressed:
+                regressions.append((case, metric, before, value, change))
+
+    return regressions
+
+
+def report(name, results, args):
+    """
+    Print the results, save them, and check them against the baseline
+    :param name: which benchmark
+    :param results: dict of case -> dict of metric -> value
+    :param args: parsed add_arguments() options
+    :return: exit status
+    """
+
+    for case, metrics in sorted(results.items()):
+        print '%-50s %s' % (case, ' '.join(
+            '%s=%s' % (metric, round(value, 4) if isinstance(value, float) else value)
+            for metric, value in sorted(metrics.items())
+        ))
+
+    if args.output:
+        write_results(args.output, name, results)
+        print '\nWrote %s' % args.output
+
+    if args.baseline:
+        regressions = compare_results(results, args.baseline, args.threshold)
+
+        for case, metric, before, value, change in regressions:
+            print 'REGRESSION %s %s: %s -> %s (%+.1f%%)' % (
+                case, metric, before, value, change * 100
+            )
+
+        if regressions:
+            return 1
+
+        print '\nNo regressions against %s' % args.baseline
+
+    return 0
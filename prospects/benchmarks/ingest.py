@@ -0,0 +1,148 @@
+import argparse
+import sys
+from itertools import chain
+
+from prospects.batch import generate_batches, name_pool
+from prospects.benchmarks.common import (
+    add_arguments, make_client, report, timed
+)
+from prospects.bulk import (
+    chunk_sources, bulk_index_sources, parallel_bulk_index_sources
+)
+from prospects.mapping import create_index
+from prospects.prospect import Prospect
+from prospects.serializer import prospect_sources
+
+
+# Ingest throughput of each phase of index.py: generating
+# prospects, serializing them to _bulk bodies and sending them
+
+
+BENCH_INDEX = 'prospects_bench'
+
+
+def docs_per_sec(count, seconds):
+    return {'docs_per_sec': count / seconds, 'seconds': seconds}
+
+
+def bench_generation(count, start=1000):
+    """
+    Prospect objects against vectorized batches
+    :param count
+    :param start
+    """
+
+    results = {}
+
+    seconds, prospects = timed(
+        lambda: [Prospect(id) for id in range(start, start + count)]
+    )
+    results['generate/prospect'] = docs_per_sec(count, seconds)
+
+    # Made once per process, not part of generating
+    name_pool()
+
+    seconds, _ = timed(
+        lambda: [
+            doc
+            for batch in generate_batches(start, start + count, 10000)
+            for doc in batch.iter_dicts()
+        ]
+    )
+    results['generate/batch'] = docs_per_sec(count, seconds)
+
+    return results, prospects
+
+
+def bench_serialization(prospects, chunk_sizes):
+    """
+    Encoding prospects into _bulk bodies
+    :param prospects: list of Prospect
+    :param chunk_sizes
+    """
+
+    results = {}
+
+    for chunk_size in chunk_sizes:
+        seconds, chunks = timed(
+            lambda: list(chunk_sources(
+                prospect_sources(prospects), chunk_size=chunk_size
+            ))
+        )
+
+        result = docs_per_sec(len(prospects), seconds)
+        result['bytes'] = sum(len(chunk.body) for chunk in chunks)
+        results['serialize/chunk_%d' % chunk_size] = result
+
+    return results
+
+
+def bench_send(es, sources, chunk_sizes, worker_counts):
+    """
+    Sending already encoded documents
+    :param es
+    :param sources: list of (id, encoded source) pairs
+    :param chunk_sizes
+    :param worker_counts
+    """
+
+    results = {}
+
+    for chunk_size in chunk_sizes:
+        for workers in worker_counts:
+            es.indices.delete(index=BENCH_INDEX, ignore=[400, 404])
+            create_index(es, BENCH_INDEX)
+
+            if workers > 1:
+                seconds, summary = timed(
+                    parallel_bulk_index_sources, es, sources, BENCH_INDEX,
+                    workers=workers, chunk_size=chunk_size
+                )
+            else:
+                seconds, summary = timed(
+                    bulk_index_sources, es, sources, BENCH_INDEX,
+                    chunk_size=chunk_size
+                )
+
+            result = docs_per_sec(len(sources), seconds)
+            result['failed'] = summary['failed']
+            results['send/chunk_%d/workers_%d' % (chunk_size, workers)] = result
+
+    es.indices.delete(index=BENCH_INDEX, ignore=[400, 404])
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark prospect ingest')
+    add_arguments(parser)
+    parser.add_argument(
+        '--count', type=int, default=20000,
+        help='Number of prospects per run'
+    )
+    parser.add_argument(
+        '--chunk-sizes', type=int, nargs='+', default=[100, 500, 2000],
+        help='Documents per _bulk request'
+    )
+    parser.add_argument(
+        '--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+        help='_bulk requests in flight'
+    )
+    args = parser.parse_args(argv)
+
+    es = make_client(args.hosts)
+
+    results, prospects = bench_generation(args.count)
+    results.update(bench_serialization(prospects, args.chunk_sizes))
+
+    sources = list(chain.from_iterable(
+        batch.iter_sources()
+        for batch in generate_batches(1000, 1000 + args.count, 10000)
+    ))
+    results.update(bench_send(es, sources, args.chunk_sizes, args.workers))
+
+    return report('ingest', results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
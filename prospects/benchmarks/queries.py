@@ -0,0 +1,149 @@
+import argparse
+import gc
+import resource
+import sys
+import time
+
+from prospects import search
+from prospects.cache import QueryCache
+from prospects.rollup import rebuild_rollup
+from prospects.benchmarks.common import (
+    add_arguments, make_client, load_fixture, quiet, percentile, report
+)
+from prospects.settings import ES_INDEX
+
+
+# Latency of each query function in search.py, as called. They
+# print their responses, which is part of what gets measured.
+
+
+QUERIES = (
+    'get_prospect_by_id',
+    'get_prospect_by_id_exclude_fields',
+    'get_prospect_by_id_include_fields',
+    'get_prospect_source_by_id',
+    'get_prospect_source_by_id_exclude_fields',
+    'get_prospect_source_by_id_include_fields',
+    'prospect_exists',
+    'get_prospects_by_ids',
+    'get_all_prospects',
+    'get_all_active_prospects',
+    'get_prospects_bmw_three_series',
+    'filter_active_in_date_range',
+    'filter_date_range_query_sold_make',
+    'prospect_search',
+    'prospect_search_with_aggregations',
+    'prospect_rollup_aggregations',
+)
+
+
+def bench_query(fn, iterations, warmup=3):
+    """
+    Time repeated calls of a query function
+    :param fn
+    :param iterations
+    :param warmup: untimed calls first
+    """
+
+    # Peak resident memory so far, in KB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    with quiet():
+        for _ in range(warmup):
+            fn()
+
+        latencies = []
+        for _ in range(iterations):
+            started = time.time()
+            fn()
+            latencies.append((time.time() - started) * 1000)
+
+        # Python 2 has no tracemalloc, count the objects the gc
+        # tracks (containers) that one more call leaves alive
+        gc.collect()
+        before = len(gc.get_objects())
+        fn()
+        gc.collect()
+        retained = len(gc.get_objects()) - before
+
+    latencies.sort()
+
+    return {
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'retained_objects': retained,
+        'peak_rss_growth_kb':
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark search.py queries')
+    add_arguments(parser)
+    parser.add_argument(
+        '--count', type=int, default=100000,
+        help='Number of prospects to load first'
+    )
+    parser.add_argument(
+        '--iterations', type=int, default=100,
+        help='Timed calls per query'
+    )
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument(
+        '--no-load', action='store_true',
+        help='Query the index as it is, a cluster only'
+    )
+    load.add_argument(
+        '--replace-index', action='store_true',
+        help='Drop the %s index and its rollup on the cluster, and load '
+             'them with the fixture' % ES_INDEX
+    )
+    parser.add_argument(
+        '--cache', action='store_true',
+        help='Leave the search.py result cache on'
+    )
+    parser.add_argument(
+        '--queries', nargs='+', default=QUERIES, choices=QUERIES,
+        help='Query functions to run'
+    )
+    args = parser.parse_args(argv)
+
+    # The queries all look at ES_INDEX, loading a cluster replaces it
+    if args.hosts and not (args.no_load or args.replace_index):
+        parser.error(
+            'loading the fixture drops the %s index on the cluster, pass '
+            '--replace-index to do that or --no-load to query it as it is'
+            % ES_INDEX
+        )
+
+    es = make_client(args.hosts)
+    search.es = es
+
+    if not args.cache:
+        search.cache = QueryCache(size=0)
+
+    # The stand-in starts empty, it's always loaded
+    if not args.hosts or args.replace_index:
+        load_fixture(es, ES_INDEX, args.count)
+        rebuild_rollup(es, ES_INDEX)
+
+    # The by id queries all look at prospect 111
+    with quiet():
+        if not es.exists(index=ES_INDEX, doc_type=search.ES_DOC_TYPE, id=111):
+            search.create_prospect()
+
+    results = {}
+    for name in args.queries:
+        results['query/%s' % name] = bench_query(
+            getattr(search, name), args.iterations
+        )
+
+    if args.cache:
+        print 'Cache: %s' % search.cache.stats()
+
+    return report('queries', results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import argparse
+import subprocess
+import sys
+
+from prospects.benchmarks.common import (
+    add_arguments, percentile, report
+)
+
+
+# Time to import each entry point in a fresh interpreter, and
+# whether that pulled in Faker. Query-only processes shouldn't.
+
+
+MODULES = (
+    'prospects.prospect',
+    'prospects.search',
+    'prospects.index',
+    'prospects.export',
+)
+
+# Run in the child, prints the seconds taken and whether
+# faker was imported
+SCRIPT = '''
+import sys, time
+started = time.time()
+%s
+print time.time() - started, int('faker' in sys.modules)
+'''
+
+
+def time_statement(statement):
+    """
+    Run a statement in a new interpreter
+    :param statement
+    :return: (seconds taken, whether faker was imported)
+    """
+
+    output = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT % statement]
+    )
+    seconds, faker = output.split()
+
+    return float(seconds), bool(int(faker))
+
+
+def bench_statement(statement, iterations):
+    """
+    Time a statement over several fresh interpreters
+    :param statement
+    :param iterations
+    """
+
+    runs = [time_statement(statement) for _ in range(iterations)]
+    latencies = sorted(seconds * 1000 for seconds, _ in runs)
+
+    return {
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'faker_imported': int(any(faker for _, faker in runs)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark startup time')
+    add_arguments(parser)
+    parser.add_argument(
+        '--iterations', type=int, default=10,
+        help='Fresh interpreters per module'
+    )
+    args = parser.parse_args(argv)
+
+    results = {}
+
+    for module in MODULES:
+        results['import/%s' % module] = bench_statement(
+            'import %s' % module, args.iterations
+        )
+
+    # What the first generated prospect pays for instead
+    results['generate/first_prospect'] = bench_statement(
+        'from prospects.prospect import Prospect; Prospect(1000)',
+        args.iterations
+    )
+
+    return report('startup', results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
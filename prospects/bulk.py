@@ -0,0 +1,323 @@
+import random
+import threading
+import time
+from Queue import Queue
+
+from elasticsearch.exceptions import ConnectionError, TransportError
+
+from prospects.settings import (
+    ES_INDEX,
+    ES_BULK_CHUNK_SIZE, ES_BULK_MAX_CHUNK_BYTES,
+    ES_BULK_MAX_RETRIES, ES_BULK_WORKERS,
+    ES_BULK_BACKOFF, ES_BULK_MAX_BACKOFF
+)
+from prospects.serializer import (
+    BulkBuffer, encode_id, prospect_sources
+)
+
+
+# Bulk item statuses worth sending again, the cluster
+# was too busy to take them (queue full)
+RETRY_STATUSES = (429, 503)
+
+
+def backoff(attempt, base=ES_BULK_BACKOFF, cap=ES_BULK_MAX_BACKOFF):
+    """
+    Seconds to wait before a retry, doubling with each attempt. The
+    wait is picked at random up to that, so workers turned down
+    together don't all come back together.
+    :param attempt: retries made so far
+    :param base: first wait at most
+    :param cap: longest wait
+    """
+
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def call_with_backoff(call, max_retries=ES_BULK_MAX_RETRIES, **params):
+    """
+    Make a request, backing off and making it again when it was
+    turned down as too busy, or never got an answer
+    :param call: client method, es.bulk, es.index...
+    :param max_retries
+    :param params: the request's arguments
+    """
+
+    attempt = 0
+
+    while True:
+        try:
+            return call(**params)
+        except TransportError as e:
+            busy = isinstance(e, ConnectionError) or e.status_code in RETRY_STATUSES
+            if not busy or attempt >= max_retries:
+                raise
+
+        time.sleep(backoff(attempt))
+        attempt += 1
+
+
+def send_bulk(es, body, max_retries=ES_BULK_MAX_RETRIES, **params):
+    """
+    es.bulk, see call_with_backoff
+    :param es
+    :param body: encoded _bulk body
+    :param max_retries
+    :param params: the rest of es.bulk's arguments
+    """
+
+    return call_with_backoff(es.bulk, max_retries, body=body, **params)
+
+
+def chunk_sources(sources, index=ES_INDEX,
+                  chunk_size=ES_BULK_CHUNK_SIZE,
+                  max_chunk_bytes=ES_BULK_MAX_CHUNK_BYTES,
+                  version=None):
+    """
+    Write encoded sources into _bulk request bodies limited by
+    both the number of documents and the size of the body
+    :param sources: iterable of (id, encoded source) pairs
+    :param index
+    :param chunk_size: max documents per chunk
+    :param max_chunk_bytes: max request body size per chunk
+    :param version: external version to index them all with
+    :return: generator of BulkChunk
+    """
+
+    buffer = BulkBuffer(index, version=version)
+    fixed = len(buffer.action) + len(buffer.action_end) + 1
+
+    for doc_id, source in sources:
+        size = fixed + len(encode_id(doc_id)) + len(source)
+
+        if len(buffer) and (len(buffer) >= chunk_size or
+                            buffer.nbytes + size > max_chunk_bytes):
+            yield buffer.take()
+
+        buffer.add(doc_id, source)
+
+    if len(buffer):
+        yield buffer.take()
+
+
+def new_summary():
+    """
+    An empty bulk summary
+    """
+
+    return {
+        'indexed': 0,
+        'failed': 0,
+        'retried': 0,
+        'errors': []
+    }
+
+
+def merge_summary(summary, other):
+    """
+    Add the counts of one summary to another
+    :param summary
+    :param other
+    """
+
+    summary['indexed'] += other['indexed']
+    summary['failed'] += other['failed']
+    summary['retried'] += other['retried']
+    summary['errors'].extend(other['errors'])
+
+    return summary
+
+
+def send_chunk(es, chunk, max_retries=ES_BULK_MAX_RETRIES, on_item=None):
+    """
+    Send one chunk with the _bulk API, resending items
+    the cluster rejected as too busy
+    :param es
+    :param chunk: BulkChunk
+    :param max_retries
+    :param on_item: called with the id, status and bulk item of
+        every item once it's done, succeeded or not
+    :return: summary dict
+    """
+
+    summary = new_summary()
+    attempt = 0
+
+    while len(chunk):
+        if attempt:
+            time.sleep(backoff(attempt - 1))
+
+        # The body is already encoded, the client sends it as is
+        response = send_bulk(es, chunk.body, max_retries)
+
+        retry = []
+        for i, item in enumerate(response['items']):
+            result = item.values()[0]
+            status = result.get('status', 500)
+
+            if status in RETRY_STATUSES and attempt < max_retries:
+                retry.append(i)
+                continue
+
+            if status < 300:
+                summary['indexed'] += 1
+            else:
+                summary['failed'] += 1
+                summary['errors'].append({
+                    'id': chunk.ids[i],
+                    'status': status,
+                    'error': result.get('error')
+                })
+
+            if on_item:
+                on_item(chunk.ids[i], status, result)
+
+        summary['retried'] += len(retry)
+        chunk = chunk.subset(retry)
+        attempt += 1
+
+    return summary
+
+
+def bulk_index_prospects(es, prospects, index=ES_INDEX, **kwargs):
+    """
+    Index the given Prospects in Elastic Search using the _bulk API,
+    see bulk_index_sources
+    :param es
+    :param prospects: iterable of Prospect
+    :param index
+    """
+
+    return bulk_index_sources(
+        es, prospect_sources(prospects), index, **kwargs
+    )
+
+
+def bulk_index_sources(es, sources, index=ES_INDEX,
+                       chunk_size=ES_BULK_CHUNK_SIZE,
+                       max_chunk_bytes=ES_BULK_MAX_CHUNK_BYTES,
+                       max_retries=ES_BULK_MAX_RETRIES,
+                       on_chunk=None):
+    """
+    Index encoded documents in Elastic Search using the _bulk API
+    :param es
+    :param sources: iterable of (id, encoded source) pairs
+    :param index
+    :param chunk_size: max documents per request
+    :param max_chunk_bytes: max request body size
+    :param max_retries: times to resend rejected items
+    :param on_chunk: called with each chunk and its summary once
+        it's been sent
+    :return: dict of indexed, failed and retried counts, plus
+        the per item errors
+    """
+
+    summary = new_summary()
+
+    chunks = chunk_sources(sources, index, chunk_size, max_chunk_bytes)
+
+    for chunk in chunks:
+        result = send_chunk(es, chunk, max_retries)
+        merge_summary(summary, result)
+
+        if on_chunk:
+            on_chunk(chunk, result)
+
+    return summary
+
+
+def parallel_bulk_index_prospects(es, prospects, index=ES_INDEX, **kwargs):
+    """
+    Index the given Prospects using a pool of threads,
+    see parallel_bulk_index_sources
+    :param es
+    :param prospects: iterable of Prospect
+    :param index
+    """
+
+    return parallel_bulk_index_sources(
+        es, prospect_sources(prospects), index, **kwargs
+    )
+
+
+def parallel_bulk_index_sources(es, sources, index=ES_INDEX,
+                                workers=ES_BULK_WORKERS,
+                                chunk_size=ES_BULK_CHUNK_SIZE,
+                                max_chunk_bytes=ES_BULK_MAX_CHUNK_BYTES,
+                                max_retries=ES_BULK_MAX_RETRIES,
+                                on_chunk=None):
+    """
+    Index encoded documents using a pool of threads, each with
+    one _bulk request in flight. Chunks are generated while earlier
+    ones are being sent, the queue between the two is bounded so
+    generation can't run away from the cluster. If a worker
+    fails, no more chunks are sent and its exception is raised.
+    :param es
+    :param sources: iterable of (id, encoded source) pairs
+    :param index
+    :param workers: number of bulk requests in flight
+    :param chunk_size: max documents per request
+    :param max_chunk_bytes: max request body size
+    :param max_retries: times to resend rejected items
+    :param on_chunk: called with each chunk and its summary once
+        it's been sent, one call at a time
+    :return: dict of indexed, failed and retried counts, plus
+        the per item errors
+    """
+
+    summary = new_summary()
+    exceptions = []
+    lock = threading.Lock()
+    queue = Queue(maxsize=workers * 2)
+
+    # Set when a worker fails, the rest of the load is dropped
+    stop = threading.Event()
+
+    def worker():
+        while True:
+            chunk = queue.get()
+            if chunk is None:
+                break
+
+            # Drain the queue, the producer is blocked on it
+            if stop.is_set():
+                continue
+
+            try:
+                result = send_chunk(es, chunk, max_retries)
+
+                with lock:
+                    merge_summary(summary, result)
+
+                    if on_chunk:
+                        on_chunk(chunk, result)
+            except Exception as e:
+                with lock:
+                    exceptions.append(e)
+                stop.set()
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        chunks = chunk_sources(sources, index, chunk_size, max_chunk_bytes)
+
+        for chunk in chunks:
+            if stop.is_set():
+                break
+
+            # Blocks while all the workers are busy
+            queue.put(chunk)
+    finally:
+        for _ in threads:
+            queue.put(None)
+
+        for thread in threads:
+            thread.join()
+
+    if exceptions:
+        raise exceptions[0]
+
+    return summary
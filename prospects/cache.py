@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from prospects.settings import (
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL
+)
+
+
+class QueryCache(object):
+    """
+    Size bounded LRU cache of query responses, with a TTL. Entries
+    are dropped per index when something writes to it.
+
+    Responses are shared between callers, don't modify them.
+    """
+
+    def __init__(self, size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.by_index = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(params):
+        """
+        Normalized signature of a request, the same query
+        written in a different key order gets the same key
+        :param params: the request's keyword arguments
+        """
+
+        def normalize(value):
+            if isinstance(value, basestring):
+                # Encoded bodies are compared decoded
+                try:
+                    return json.loads(value)
+                except ValueError:
+                    return value
+            if isinstance(value, (list, tuple)):
+                return [normalize(v) for v in value]
+            return value
+
+        return json.dumps(
+            dict((k, normalize(v)) for k, v in params.items()),
+            sort_keys=True
+        )
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            index, expires, response = entry
+            if expires < time.time():
+                self.drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries[key] = self.entries.pop(key)
+            self.hits += 1
+
+            return response
+
+    def put(self, key, index, response):
+        with self.lock:
+            if key in self.entries:
+                self.drop(key)
+
+            self.entries[key] = (index, time.time() + self.ttl, response)
+            self.by_index.setdefault(index, set()).add(key)
+
+            while len(self.entries) > self.size:
+                oldest = next(iter(self.entries))
+                self.drop(oldest)
+                self.evictions += 1
+
+    def drop(self, key):
+        index, _, _ = self.entries.pop(key)
+
+        keys = self.by_index.get(index)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_index[index]
+
+    def call(self, fn, **params):
+        """
+        Get fn(**params) from the cache, calling it on a miss
+        :param fn: es.search or the like
+        :param params: keyword arguments, including index
+        """
+
+        if not self.size:
+            return fn(**params)
+
+        # The same arguments to another API are another response
+        key = '%s:%s' % (fn.__name__, self.key(params))
+        response = self.get(key)
+
+        if response is None:
+            response = fn(**params)
+            self.put(key, params.get('index'), response)
+
+        return response
+
+    def invalidate(self, index=None):
+        """
+        Drop the entries for an index, or everything
+        :param index
+        """
+
+        with self.lock:
+            if index is None:
+                keys = list(self.entries)
+            else:
+                keys = list(self.by_index.get(index, ()))
+
+            for key in keys:
+                self.drop(key)
+
+            self.invalidations += len(keys)
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self):
+        """
+        Counters, to tune the size and TTL by
+        """
+
+        with self.lock:
+            lookups = self.hits + self.misses
+
+            return {
+                'size': len(self.entries),
+                'max_size': self.size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / float(lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
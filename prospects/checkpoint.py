@@ -0,0 +1,194 @@
+import json
+import os
+
+from prospects.settings import (
+    ES_CHECKPOINT, ES_DEAD_LETTER
+)
+
+
+# Resumable loads. Prospects are generated in id order and sent in
+# chunks of consecutive ids, so how far a load got is one id: every
+# prospect below it was either acknowledged by the cluster or written
+# to the dead letter file. Chunks finish out of order with several
+# workers, the checkpoint only moves past a chunk once all those
+# before it are done too.
+
+
+class Checkpoint(object):
+    """
+    The id a load resumes from, kept in a JSON file
+    """
+
+    def __init__(self, path=ES_CHECKPOINT, index=None, start=None, stop=None,
+                 next_id=None, indexed=0, dead=0):
+        """
+        :param path
+        :param index: the index being loaded
+        :param start: first id of the whole load
+        :param stop: id the load ends before
+        :param next_id: every id below this is done
+        :param indexed: prospects acknowledged so far
+        :param dead: prospects dead lettered so far
+        """
+
+        self.path = path
+        self.index = index
+        self.start = start
+        self.stop = stop
+        self.next_id = start if next_id is None else next_id
+        self.indexed = indexed
+        self.dead = dead
+
+        # first id -> (last id, indexed, dead) of chunks done
+        # ahead of next_id
+        self.done = {}
+
+    @classmethod
+    def load(cls, path=ES_CHECKPOINT):
+        """
+        Load the checkpoint of a broken load
+        :param path
+        :return: Checkpoint, None if there's no load to resume
+        """
+
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            state = json.load(f)
+
+        return cls(path, **state)
+
+    def save(self):
+        """
+        Write the checkpoint, replacing the old one in one step
+        """
+
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump({
+                'index': self.index,
+                'start': self.start,
+                'stop': self.stop,
+                'next_id': self.next_id,
+                'indexed': self.indexed,
+                'dead': self.dead,
+            }, f)
+
+        os.rename(temp, self.path)
+
+    def remove(self):
+        """
+        The load finished, there's nothing to resume
+        """
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @property
+    def finished(self):
+        return self.next_id >= self.stop
+
+    def chunk_done(self, first_id, last_id, indexed, dead):
+        """
+        Record a chunk of consecutive ids as sent, saving the
+        checkpoint if that moves it on
+        :param first_id
+        :param last_id
+        :param indexed: how many of them were acknowledged
+        :param dead: how many were dead lettered
+        """
+
+        self.done[first_id] = (last_id, indexed, dead)
+
+        moved = False
+        while self.next_id in self.done:
+            last_id, indexed, dead = self.done.pop(self.next_id)
+
+            self.next_id = last_id + 1
+            self.indexed += indexed
+            self.dead += dead
+            moved = True
+
+        if moved:
+            self.save()
+
+
+class DeadLetters(object):
+    """
+    NDJSON file of the documents the cluster wouldn't take, each
+    with why, so they can be looked at and sent again
+    """
+
+    def __init__(self, path=ES_DEAD_LETTER):
+        self.path = path
+        self.file = None
+
+    def clear(self):
+        """
+        Start a new file, for a new load
+        """
+
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def write(self, doc_id, status, error, source):
+        """
+        Add a document
+        :param doc_id
+        :param status: the bulk item status
+        :param error: the bulk item error
+        :param source: the encoded source
+        """
+
+        if self.file is None:
+            self.file = open(self.path, 'a')
+
+        self.file.write('{"_id": %s, "status": %s, "error": %s, "_source": %s}\n' % (
+            json.dumps(doc_id), json.dumps(status), json.dumps(error), source
+        ))
+
+        # Flushed before the checkpoint can move past it
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def chunk_source(chunk, i):
+    """
+    The encoded source of item i of a BulkChunk of index actions
+    :param chunk
+    :param i
+    """
+
+    return chunk.lines(i).split('\n', 1)[1].rstrip('\n')
+
+
+def checkpointer(checkpoint, dead_letters):
+    """
+    An on_chunk callback for bulk_index_sources and
+    parallel_bulk_index_sources, dead lettering the items that
+    failed for good and moving the checkpoint on
+    :param checkpoint: Checkpoint
+    :param dead_letters: DeadLetters
+    """
+
+    def on_chunk(chunk, result):
+        if result['errors']:
+            positions = dict((doc_id, i) for i, doc_id in enumerate(chunk.ids))
+
+            for error in result['errors']:
+                dead_letters.write(
+                    error['id'], error['status'], error['error'],
+                    chunk_source(chunk, positions[error['id']])
+                )
+
+        checkpoint.chunk_done(
+            chunk.ids[0], chunk.ids[-1], result['indexed'], result['failed']
+        )
+
+    return on_chunk
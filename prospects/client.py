@@ -0,0 +1,130 @@
+import threading
+import zlib
+
+import urllib3
+from elasticsearch import Elasticsearch, Urllib3HttpConnection
+
+from prospects.metrics import instrument
+from prospects.settings import (
+    ES_FAKE, ES_HOSTS, ES_POOL_SIZE, ES_TIMEOUT,
+    ES_MAX_RETRIES, ES_RETRY_ON_TIMEOUT,
+    ES_SNIFF, ES_SNIFF_INTERVAL, ES_HTTP_COMPRESS
+)
+
+
+# One client per process, built on first use. It keeps a pool of
+# persistent connections per node, so threads searching or loading
+# at once share connections instead of opening their own.
+
+_client = None
+_lock = threading.Lock()
+
+
+def gzip_body(body):
+    """
+    Gzip a request body
+    :param body: str
+    """
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    return compressor.compress(body) + compressor.flush()
+
+
+class GzipPool(object):
+    """
+    Wraps a urllib3 connection pool, gzipping request bodies
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+    def urlopen(self, method, url, body=None, headers=None, **kwargs):
+        if body:
+            body = gzip_body(body)
+            headers = dict(headers or {}, **{'content-encoding': 'gzip'})
+
+        return self.pool.urlopen(method, url, body, headers=headers, **kwargs)
+
+
+class GzipConnection(Urllib3HttpConnection):
+    """
+    Connection sending gzipped bodies and accepting gzipped
+    responses, the 1.x client can't do either by itself
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(GzipConnection, self).__init__(*args, **kwargs)
+
+        self.headers.update(urllib3.make_headers(accept_encoding=True))
+        self.pool = GzipPool(self.pool)
+
+
+def new_client(hosts=ES_HOSTS, pool_size=ES_POOL_SIZE, timeout=ES_TIMEOUT,
+               max_retries=ES_MAX_RETRIES, compress=ES_HTTP_COMPRESS,
+               sniff=ES_SNIFF):
+    """
+    Build a client from the settings
+    :param hosts
+    :param pool_size: connections kept open per node
+    :param timeout: seconds per request
+    :param max_retries: times a request is tried on another node
+    :param compress: gzip requests and responses
+    :param sniff: discover the other nodes of the cluster
+    """
+
+    kwargs = {}
+    if compress:
+        kwargs['connection_class'] = GzipConnection
+    if sniff:
+        kwargs.update(
+            sniff_on_start=True,
+            sniff_on_connection_fail=True,
+            sniffer_timeout=ES_SNIFF_INTERVAL
+        )
+
+    return Elasticsearch(
+        hosts,
+        maxsize=pool_size,
+        timeout=timeout,
+        max_retries=max_retries,
+        retry_on_timeout=ES_RETRY_ON_TIMEOUT,
+        **kwargs
+    )
+
+
+def get_client():
+    """
+    The shared client, built on first use. The in process
+    stand-in if ES_FAKE is set, recording metrics if they're on.
+    """
+
+    global _client
+
+    if _client is None:
+        with _lock:
+            if _client is None:
+                if ES_FAKE:
+                    from prospects.fake_es import shared_client
+                    client = shared_client()
+                else:
+                    client = new_client()
+
+                _client = instrument(client)
+
+    return _client
+
+
+class LazyClient(object):
+    """
+    Stands in for the shared client at import time, building
+    it on the first call through it
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
+
+es = LazyClient()
@@ -0,0 +1,306 @@
+import json
+import sys
+from array import array
+
+from prospects.prospect import FIELDS, ProspectValues
+
+
+# A memory comparison prototype: prospects held as arrays of codes
+# instead of objects, see the driver below. Nothing loads from or
+# exports through it yet.
+
+# Low cardinality fields, stored as a code into the values
+# ProspectProvider draws from. Codes are a byte each, widened
+# if a field ever gets more values than that.
+CATEGORIES = {
+    'postal_code': ProspectValues.POSTAL_CODES,
+    'status': ProspectValues.STATUSES,
+    'program': ProspectValues.PROGRAMS,
+    'new_used': ProspectValues.NEW_USED,
+    'assigned_to': ProspectValues.ASSIGNED_TO,
+    'year': ProspectValues.YEARS,
+    'make': ProspectValues.MAKES,
+    'model': tuple(
+        model
+        for make in ProspectValues.MAKES
+        for model in ProspectValues.MODELS[make]
+    ),
+}
+
+# Booleans, packed as bits of one byte
+FLAGS = ('has_manual_offers', 'has_automated_offers', 'sold')
+
+
+def format_date(packed):
+    """
+    Format a yyyymmdd int as yyyy-mm-dd
+    :param packed
+    """
+
+    return '%04d-%02d-%02d' % (
+        packed // 10000, packed // 100 % 100, packed % 100
+    )
+
+
+class Vocabulary(object):
+    """
+    Two way mapping between values and small integer codes
+    """
+
+    def __init__(self, values=()):
+        self.values = []
+        self.codes = {}
+
+        for value in values:
+            self.code(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        """
+        Get the code for a value, adding it if it's new
+        :param value
+        """
+
+        try:
+            return self.codes[value]
+        except KeyError:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            return code
+
+
+class ProspectRecord(object):
+    """
+    Lightweight, fixed layout Prospect
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, *values):
+        for field, value in zip(FIELDS, values):
+            setattr(self, field, value)
+
+    def as_dict(self):
+        return dict((field, getattr(self, field)) for field in FIELDS)
+
+    def __repr__(self):
+        return json.dumps(
+            self.as_dict(),
+            sort_keys=True,
+            indent=2
+        )
+
+
+class ProspectColumns(object):
+    """
+    Array backed column store of Prospects. Categorical fields are
+    kept as codes and serialized straight from them.
+    """
+
+    def __init__(self):
+        self.ids = array('l')
+        # prospect_date as a yyyymmdd int
+        self.dates = array('i')
+        self.certificate_ids = array('i')
+        self.flags = array('B')
+
+        # Names and emails are interned, repeats cost a code only
+        self.names = Vocabulary()
+        self.emails = Vocabulary()
+        self.name_codes = array('I')
+        self.email_codes = array('I')
+
+        self.vocabularies = dict(
+            (field, Vocabulary(values))
+            for field, values in CATEGORIES.items()
+        )
+        self.codes = dict((field, array('B')) for field in CATEGORIES)
+
+        # JSON for every (field, code) pair, made once per code
+        self.fragments = dict((field, []) for field in CATEGORIES)
+        self.date_fragments = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, doc):
+        """
+        Add a Prospect, as a dict of its fields
+        :param doc: Prospect.as_dict() style dict
+        """
+
+        self.ids.append(doc['id'])
+        self.name_codes.append(self.names.code(doc['name']))
+        self.email_codes.append(self.emails.code(doc['email_address']))
+
+        self.dates.append(int(doc['prospect_date'].replace('-', '')))
+        self.certificate_ids.append(int(doc['certificate_id'], 16))
+
+        bits = 0
+        for i, field in enumerate(FLAGS):
+            if doc[field]:
+                bits |= 1 << i
+        self.flags.append(bits)
+
+        for field, vocabulary in self.vocabularies.items():
+            code = vocabulary.code(doc[field])
+
+            codes = self.codes[field]
+            if code > 0xFF and codes.typecode == 'B':
+                codes = self.codes[field] = array('I', codes)
+            codes.append(code)
+
+    def extend(self, docs):
+        """
+        Add many Prospects
+        :param docs: iterable of Prospect.as_dict() style dicts
+        """
+
+        for doc in docs:
+            self.append(doc)
+
+    def record(self, i):
+        """
+        Get row i as a ProspectRecord
+        :param i
+        """
+
+        values = dict(
+            (field, self.vocabularies[field].values[self.codes[field][i]])
+            for field in CATEGORIES
+        )
+        values['id'] = self.ids[i]
+        values['name'] = self.names.values[self.name_codes[i]]
+        values['email_address'] = self.emails.values[self.email_codes[i]]
+        values['prospect_date'] = format_date(self.dates[i])
+        values['certificate_id'] = '%06X' % self.certificate_ids[i]
+
+        for bit, field in enumerate(FLAGS):
+            values[field] = bool(self.flags[i] & (1 << bit))
+
+        return ProspectRecord(*[values[field] for field in FIELDS])
+
+    def __getitem__(self, i):
+        return self.record(i)
+
+    def field_fragments(self, field):
+        """
+        The JSON fragment of each code of a categorical field,
+        made for the codes added since last time
+        :param field
+        """
+
+        fragments = self.fragments[field]
+        values = self.vocabularies[field].values
+
+        for value in values[len(fragments):]:
+            fragments.append('"%s": %s' % (field, json.dumps(value)))
+
+        return fragments
+
+    def date_fragment(self, packed):
+        try:
+            return self.date_fragments[packed]
+        except KeyError:
+            fragment = self.date_fragments[packed] = (
+                '"prospect_date": "%s"' % format_date(packed)
+            )
+            return fragment
+
+    def iter_ndjson(self):
+        """
+        Iterate the rows as newline terminated JSON documents
+        """
+
+        for _, source in self.iter_sources():
+            yield source + '\n'
+
+    def iter_sources(self):
+        """
+        Iterate the rows as (id, encoded source) pairs, built
+        from the codes without an intermediate dict
+        """
+
+        categories = [
+            (self.field_fragments(field), self.codes[field])
+            for field in CATEGORIES
+        ]
+        names, emails = self.names.values, self.emails.values
+        flag_fragments = [
+            ('"%s": true' % field, '"%s": false' % field, 1 << bit)
+            for bit, field in enumerate(FLAGS)
+        ]
+
+        for i in xrange(len(self.ids)):
+            doc_id = self.ids[i]
+            parts = [
+                '"id": %d' % doc_id,
+                '"name": %s' % json.dumps(names[self.name_codes[i]]),
+                '"email_address": %s' % json.dumps(emails[self.email_codes[i]]),
+                self.date_fragment(self.dates[i]),
+                '"certificate_id": "%06X"' % self.certificate_ids[i],
+            ]
+            parts.extend(fragments[codes[i]] for fragments, codes in categories)
+            parts.extend(
+                true if self.flags[i] & bit else false
+                for true, false, bit in flag_fragments
+            )
+
+            yield doc_id, '{%s}' % ', '.join(parts)
+
+    def nbytes(self):
+        """
+        Approximate memory used by the store, in bytes
+        """
+
+        arrays = [
+            self.ids, self.dates, self.certificate_ids, self.flags,
+            self.name_codes, self.email_codes
+        ] + self.codes.values()
+
+        total = sum(a.itemsize * len(a) for a in arrays)
+        for vocabulary in (self.names, self.emails):
+            total += sum(sys.getsizeof(v) for v in vocabulary.values)
+            total += sys.getsizeof(vocabulary.values)
+            total += sys.getsizeof(vocabulary.codes)
+
+        return total
+
+
+def object_nbytes(prospect):
+    """
+    Approximate memory used by one Prospect object, in bytes
+    :param prospect
+    """
+
+    total = sys.getsizeof(prospect) + sys.getsizeof(prospect.__dict__)
+
+    # The categorical strings and bools are shared constants,
+    # only count the values each instance owns
+    for field in ('id', 'name', 'email_address',
+                  'prospect_date', 'certificate_id'):
+        total += sys.getsizeof(getattr(prospect, field))
+
+    return total
+
+
+if __name__ == "__main__":
+    """
+    Memory comparison driver
+    """
+
+    from prospects.batch import ProspectBatch
+    from prospects.prospect import Prospect
+
+    count = 1000000
+
+    columns = ProspectColumns()
+    columns.extend(ProspectBatch.generate(1000, count).iter_dicts())
+
+    sample = [Prospect(id) for id in range(1000, 2000)]
+    per_object = sum(object_nbytes(p) for p in sample) / float(len(sample))
+
+    print 'Prospect objects: %.1f MB' % (per_object * count / 2 ** 20)
+    print 'ProspectColumns:  %.1f MB' % (columns.nbytes() / 2.0 ** 20)
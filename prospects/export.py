@@ -0,0 +1,266 @@
+import argparse
+import csv
+import sys
+import threading
+import time
+from Queue import Queue
+
+from prospects import serializer
+from prospects.settings import (
+    ES_INDEX, ES_DOC_TYPE,
+    ES_EXPORT_SLICES, ES_EXPORT_PAGE_SIZE
+)
+
+
+# ES 1.x has neither sliced scroll nor search_after. Slices are
+# ranges of the integer id field instead, each one scrolled in
+# id order by its own thread.
+
+SCROLL_TIMEOUT = '2m'
+
+# Marks the end of a slice in its queue
+DONE = object()
+
+
+def id_bounds(es, index=ES_INDEX, query=None):
+    """
+    Get the lowest and highest prospect id
+    :param es
+    :param index
+    :param query: only prospects matching this
+    :return: (low, high), None if nothing matches
+    """
+
+    body = {
+        'aggs': {
+            'low': {'min': {'field': 'id'}},
+            'high': {'max': {'field': 'id'}},
+        }
+    }
+    if query:
+        body['query'] = query
+
+    response = es.search(index=index, doc_type=ES_DOC_TYPE, body=body, size=0)
+    low = response['aggregations']['low']['value']
+    high = response['aggregations']['high']['value']
+
+    if low is None:
+        return None
+
+    return int(low), int(high)
+
+
+def slice_ranges(low, high, slices):
+    """
+    Split the ids from low to high, inclusive, into contiguous ranges
+    :return: list of (from, to) pairs, to exclusive
+    """
+
+    step = max((high - low + 1 + slices - 1) // slices, 1)
+
+    return [
+        (lo, min(lo + step, high + 1))
+        for lo in range(low, high + 1, step)
+    ]
+
+
+def scroll_slice(es, lo, hi, index=ES_INDEX, query=None, fields=None,
+                 page_size=ES_EXPORT_PAGE_SIZE):
+    """
+    Stream the sources of the prospects with lo <= id < hi, in id order
+    :param es
+    :param lo
+    :param hi
+    :param index
+    :param query: only prospects matching this
+    :param fields: only these source fields
+    :param page_size
+    """
+
+    ranged = {'range': {'id': {'gte': lo, 'lt': hi}}}
+
+    body = {
+        'query': {
+            'bool': {'must': [ranged, query] if query else [ranged]}
+        },
+        'sort': [{'id': 'asc'}],
+    }
+    if fields:
+        body['_source'] = {'include': fields}
+
+    response = es.search(
+        index=index,
+        doc_type=ES_DOC_TYPE,
+        body=body,
+        size=page_size,
+        scroll=SCROLL_TIMEOUT
+    )
+    scroll_id = response.get('_scroll_id')
+
+    try:
+        while response['hits']['hits']:
+            for hit in response['hits']['hits']:
+                yield hit['_source']
+
+            response = es.scroll(scroll_id=scroll_id, scroll=SCROLL_TIMEOUT)
+            scroll_id = response.get('_scroll_id', scroll_id)
+    finally:
+        if scroll_id:
+            es.clear_scroll(scroll_id=scroll_id, ignore=404)
+
+
+def export_prospects(es, index=ES_INDEX, query=None, fields=None,
+                     slices=ES_EXPORT_SLICES, page_size=ES_EXPORT_PAGE_SIZE):
+    """
+    Stream the sources of all prospects, in id order. The id range
+    is split into slices, each scrolled by its own thread. Threads
+    run ahead by at most two pages, so memory use doesn't grow with
+    the size of the index.
+    :param es
+    :param index
+    :param query: only prospects matching this
+    :param fields: only these source fields
+    :param slices: number of threads scrolling at once
+    :param page_size: documents per scroll request
+    """
+
+    bounds = id_bounds(es, index, query)
+    if bounds is None:
+        return
+
+    ranges = slice_ranges(bounds[0], bounds[1], slices)
+    queues = [Queue(maxsize=page_size * 2) for _ in ranges]
+    stop = threading.Event()
+
+    def worker(queue, lo, hi):
+        try:
+            for source in scroll_slice(es, lo, hi, index, query, fields, page_size):
+                if stop.is_set():
+                    return
+                queue.put(source)
+        except Exception as e:
+            queue.put(e)
+
+        queue.put(DONE)
+
+    threads = [
+        threading.Thread(target=worker, args=(queue, lo, hi))
+        for queue, (lo, hi) in zip(queues, ranges)
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        # Slices are read back in order, later ones wait
+        # in their queues meanwhile
+        for queue in queues:
+            while True:
+                item = queue.get()
+                if item is DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                yield item
+    finally:
+        stop.set()
+
+        # Unblock threads still waiting on a full queue, so
+        # they can stop and clear their scrolls
+        for thread, queue in zip(threads, queues):
+            while thread.is_alive():
+                while not queue.empty():
+                    queue.get_nowait()
+                thread.join(0.01)
+
+
+def write_ndjson(docs, out):
+    """
+    Write documents, one JSON object per line
+    :param docs
+    :param out: file
+    :return: number written
+    """
+
+    count = 0
+    for doc in docs:
+        out.write(serializer.dumps(doc))
+        out.write('\n')
+        count += 1
+
+    return count
+
+
+def write_csv(docs, out, fields):
+    """
+    Write documents as CSV, with a header row
+    :param docs
+    :param out: file
+    :param fields: the columns
+    :return: number written
+    """
+
+    writer = csv.writer(out)
+    writer.writerow(fields)
+
+    count = 0
+    for doc in docs:
+        writer.writerow([
+            unicode(doc.get(field, '')).encode('utf-8') for field in fields
+        ])
+        count += 1
+
+    return count
+
+
+if __name__ == "__main__":
+    """
+    Export Driver
+    """
+
+    from prospects.client import es
+    from prospects.prospect import FIELDS
+
+    parser = argparse.ArgumentParser(description='Export all prospects')
+    parser.add_argument(
+        '--format', choices=['ndjson', 'csv'], default='ndjson'
+    )
+    parser.add_argument(
+        '--output',
+        help='File to write, stdout if not given'
+    )
+    parser.add_argument(
+        '--fields', nargs='+',
+        help='Only export these fields'
+    )
+    parser.add_argument(
+        '--slices', type=int, default=ES_EXPORT_SLICES,
+        help='Id ranges scrolled in parallel'
+    )
+    parser.add_argument(
+        '--page-size', type=int, default=ES_EXPORT_PAGE_SIZE,
+        help='Documents per scroll request'
+    )
+    args = parser.parse_args()
+
+    out = open(args.output, 'wb') if args.output else sys.stdout
+    started = time.time()
+
+    docs = export_prospects(
+        es, fields=args.fields, slices=args.slices, page_size=args.page_size
+    )
+
+    try:
+        if args.format == 'csv':
+            count = write_csv(docs, out, args.fields or list(FIELDS))
+        else:
+            count = write_ndjson(docs, out)
+    finally:
+        if args.output:
+            out.close()
+
+    elapsed = time.time() - started
+    sys.stderr.write('Exported %d prospects in %.1fs (%.0f docs/sec)\n' % (
+        count, elapsed, count / elapsed if elapsed else 0
+    ))
@@ -0,0 +1,1424 @@
+import fnmatch
+import heapq
+import itertools
+import json
+import re
+import threading
+import time
+from functools import wraps
+
+from elasticsearch.exceptions import (
+    TransportError, NotFoundError, ConflictError, RequestError
+)
+
+
+# In process stand-in for the parts of the Elasticsearch client
+# this project uses. Documents are kept in memory with an inverted
+# index per field, so it's quick enough to benchmark the client
+# side of the loader and the queries without a cluster.
+#
+# Writes are visible straight away, refresh is a no-op.
+
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+DATE = re.compile(r'^\d{4}-\d{2}-\d{2}')
+
+# Field types from an explicit mapping
+MAPPING_TYPES = {
+    'date': 'date',
+    'boolean': 'boolean',
+    'integer': 'long',
+    'long': 'long',
+    'short': 'long',
+    'float': 'double',
+    'double': 'double',
+}
+
+# What a term of each type is stored as
+TERM_TYPES = {
+    'keyword': unicode,
+    'date': unicode,
+    'boolean': bool,
+    'long': int,
+    'double': float,
+}
+
+
+def tokenize(value):
+    """
+    The standard analyzer, near enough
+    :param value
+    """
+
+    return TOKEN.findall(unicode(value).lower())
+
+
+def as_list(value):
+    """
+    Parameters can come as a list or a comma separated string
+    :param value
+    """
+
+    if value is None:
+        return []
+    if isinstance(value, basestring):
+        return value.split(',')
+
+    return list(value)
+
+
+def loads(body):
+    """
+    Bodies can come encoded or not
+    :param body
+    """
+
+    if isinstance(body, basestring):
+        return json.loads(body)
+
+    return body
+
+
+def ignorable(method):
+    """
+    Support the client's ignore parameter, return the error
+    body instead of raising for the given statuses
+    """
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        ignore = kwargs.pop('ignore', ())
+        if isinstance(ignore, int):
+            ignore = (ignore,)
+
+        try:
+            return method(*args, **kwargs)
+        except TransportError as e:
+            if e.status_code in ignore:
+                return e.info
+            raise
+
+    return wrapper
+
+
+def locked(method):
+    """
+    Reads and writes hold the client's lock, the loader sends
+    from several threads at once and searches run alongside it
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def error(cls, status, message):
+    return cls(status, message, {'error': message, 'status': status})
+
+
+def sort_fields(sort):
+    """
+    Turn a sort, in any of the forms ES takes, into a list
+    of (field, descending) pairs
+    :param sort
+    """
+
+    fields = []
+
+    for item in as_list(sort):
+        if isinstance(item, dict):
+            (field, order), = item.items()
+            if isinstance(order, dict):
+                order = order.get('order', 'asc')
+        elif ':' in item:
+            field, order = item.split(':', 1)
+        else:
+            field, order = item, 'desc' if item == '_score' else 'asc'
+
+        fields.append((field, order == 'desc'))
+
+    return fields
+
+
+def filter_source(source, includes=None, excludes=None):
+    """
+    Apply _source_include and _source_exclude
+    :param source
+    :param includes
+    :param excludes
+    """
+
+    includes = as_list(includes)
+    excludes = as_list(excludes)
+
+    if includes:
+        source = dict((k, v) for k, v in source.items() if k in includes)
+    if excludes:
+        source = dict((k, v) for k, v in source.items() if k not in excludes)
+
+    return source
+
+
+def filter_response(response, filter_path=None):
+    """
+    Apply filter_path, comma separated dotted paths, * matching
+    any one key
+    :param response
+    :param filter_path
+    """
+
+    if not filter_path:
+        return response
+
+    paths = [path.split('.') for path in as_list(filter_path)]
+
+    def keep(value, paths):
+        if isinstance(value, list):
+            kept = [keep(item, paths) for item in value]
+            return [item for item in kept if item is not None] or None
+
+        if not isinstance(value, dict):
+            return value
+
+        kept = {}
+        for key, item in value.items():
+            rest = [
+                path[1:] for path in paths
+                if fnmatch.fnmatchcase(key, path[0])
+            ]
+            if not rest:
+                continue
+
+            if any(not path for path in rest):
+                kept[key] = item
+            else:
+                item = keep(item, rest)
+                if item is not None:
+                    kept[key] = item
+
+        return kept or None
+
+    return keep(response, paths) or {}
+
+
+class FakeIndex(object):
+    """
+    One index: the documents, their field types and an
+    inverted index of field -> term -> ids
+    """
+
+    def __init__(self, name, body=None):
+        body = loads(body) or {}
+
+        self.name = name
+        self.docs = {}
+        self.versions = {}
+        self.types = {}
+        self.terms = {}
+        self.settings = {
+            'index.number_of_shards': '5',
+            'index.number_of_replicas': '1',
+        }
+
+        for key, value in (body.get('settings') or {}).items():
+            self.put_setting(key, value)
+
+        for doc_type in (body.get('mappings') or {}).values():
+            for field, spec in doc_type.get('properties', {}).items():
+                self.types[field] = self.mapping_type(spec)
+
+    def put_setting(self, key, value):
+        if isinstance(value, dict):
+            for k, v in value.items():
+                self.put_setting('%s.%s' % (key, k), v)
+            return
+
+        if not key.startswith('index.'):
+            key = 'index.' + key
+
+        self.settings[key] = str(value)
+
+    @staticmethod
+    def mapping_type(spec):
+        if spec.get('type') == 'string':
+            if spec.get('index') == 'not_analyzed':
+                return 'keyword'
+            return 'text'
+
+        return MAPPING_TYPES.get(spec.get('type'), 'keyword')
+
+    def field_type(self, field, value):
+        """
+        Get a field's type, mapping it from the value on first sight
+        :param field
+        :param value
+        """
+
+        try:
+            return self.types[field]
+        except KeyError:
+            pass
+
+        if isinstance(value, bool):
+            kind = 'boolean'
+        elif isinstance(value, (int, long)):
+            kind = 'long'
+        elif isinstance(value, float):
+            kind = 'double'
+        elif isinstance(value, basestring) and DATE.match(value):
+            kind = 'date'
+        else:
+            kind = 'text'
+
+        self.types[field] = kind
+        return kind
+
+    def analyze(self, field, value):
+        """
+        The terms a value is indexed as
+        :param field
+        :param value
+        """
+
+        if value is None:
+            return []
+
+        if isinstance(value, (list, tuple)):
+            terms = []
+            for v in value:
+                terms.extend(self.analyze(field, v))
+            return terms
+
+        if self.field_type(field, value) == 'text':
+            return tokenize(value)
+
+        return [self.normalize(field, value)]
+
+    def normalize(self, field, value):
+        """
+        Turn a query value into the term it's stored as
+        :param field
+        :param value
+        """
+
+        kind = self.types.get(field)
+
+        if kind == 'boolean':
+            if isinstance(value, basestring):
+                return value.lower() == 'true'
+            return bool(value)
+        if kind == 'long':
+            return int(value)
+        if kind == 'double':
+            return float(value)
+        if kind == 'keyword' or kind == 'date':
+            return unicode(value) if not isinstance(value, unicode) else value
+
+        return value
+
+    def postings(self, field, term):
+        return self.terms.get(field, {}).get(term, set())
+
+    def add(self, doc_id, source):
+        terms, types = self.terms, self.types
+
+        for field, value in source.items():
+            postings = terms.get(field)
+            if postings is None:
+                postings = terms[field] = {}
+
+            kind = types.get(field) or self.field_type(field, value)
+
+            if kind == 'text' or isinstance(value, (list, tuple)):
+                for term in self.analyze(field, value):
+                    postings.setdefault(term, set()).add(doc_id)
+                continue
+
+            if value is None:
+                continue
+
+            # Loaded JSON is mostly the right type already
+            if type(value) is not TERM_TYPES.get(kind):
+                value = self.normalize(field, value)
+
+            ids = postings.get(value)
+            if ids is None:
+                ids = postings[value] = set()
+            ids.add(doc_id)
+
+        self.docs[doc_id] = source
+
+    def remove(self, doc_id):
+        source = self.docs.pop(doc_id)
+
+        for field, value in source.items():
+            postings = self.terms[field]
+            for term in self.analyze(field, value):
+                ids = postings.get(term)
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del postings[term]
+
+        return source
+
+    def check_version(self, doc_id, version=None, version_type=None):
+        """
+        Check a write's version against the document's
+        :return: the version the document will have
+        """
+
+        current = self.versions.get(doc_id)
+
+        if version_type in ('external', 'external_gt', 'external_gte'):
+            version = int(version)
+            stale = current is not None and (
+                version < current or
+                (version == current and version_type != 'external_gte')
+            )
+            new_version = version
+        else:
+            stale = version is not None and current != int(version)
+            new_version = (current or 0) + 1
+
+        if stale:
+            raise error(
+                ConflictError, 409,
+                'VersionConflictEngineException[[%s][%s]: version conflict, '
+                'current [%s], provided [%s]]' % (
+                    self.name, doc_id, current, version
+                )
+            )
+
+        return new_version
+
+    def put(self, doc_id, source, op_type='index',
+            version=None, version_type=None):
+        """
+        Index a document
+        :return: (version, created)
+        """
+
+        exists = doc_id in self.docs
+
+        if op_type == 'create' and exists:
+            raise error(
+                ConflictError, 409,
+                'DocumentAlreadyExistsException[[%s][%s]: document already exists]' % (
+                    self.name, doc_id
+                )
+            )
+
+        new_version = self.check_version(doc_id, version, version_type)
+
+        if exists:
+            self.remove(doc_id)
+
+        self.add(doc_id, source)
+        self.versions[doc_id] = new_version
+
+        return new_version, not exists
+
+    def delete(self, doc_id, version=None, version_type=None):
+        if doc_id not in self.docs:
+            raise error(NotFoundError, 404, 'not_found')
+
+        new_version = self.check_version(doc_id, version, version_type)
+
+        self.remove(doc_id)
+        del self.versions[doc_id]
+
+        return new_version
+
+    #
+    # Queries, each evaluates to a set of ids
+    #
+
+    def all_ids(self):
+        return set(self.docs)
+
+    def query(self, query):
+        """
+        Get the ids matching a query
+        :param query: query DSL dict
+        """
+
+        if not query:
+            return self.all_ids()
+
+        (kind, spec), = query.items()
+
+        method = getattr(self, 'query_' + kind, None)
+        if method is None:
+            raise error(
+                RequestError, 400,
+                'SearchParseException[No query registered for [%s]]' % kind
+            )
+
+        return method(spec)
+
+    def query_match_all(self, spec):
+        return self.all_ids()
+
+    def query_match(self, spec):
+        (field, value), = spec.items()
+        if isinstance(value, dict):
+            value = value['query']
+
+        if self.types.get(field) != 'text':
+            return set(self.postings(field, self.normalize(field, value)))
+
+        ids = set()
+        for term in tokenize(value):
+            ids |= self.postings(field, term)
+
+        return ids
+
+    def query_match_phrase(self, spec):
+        (field, value), = spec.items()
+        if isinstance(value, dict):
+            value = value['query']
+
+        if self.types.get(field) != 'text':
+            return self.query_match(spec)
+
+        phrase = tokenize(value)
+        if not phrase:
+            return set()
+
+        candidates = set(self.postings(field, phrase[0]))
+        for term in phrase[1:]:
+            candidates &= self.postings(field, term)
+
+        ids = set()
+        n = len(phrase)
+        for doc_id in candidates:
+            tokens = tokenize(self.docs[doc_id].get(field, ''))
+            for i in range(len(tokens) - n + 1):
+                if tokens[i:i + n] == phrase:
+                    ids.add(doc_id)
+                    break
+
+        return ids
+
+    def query_term(self, spec):
+        (field, value), = spec.items()
+        if isinstance(value, dict):
+            value = value.get('value', value.get('term'))
+
+        return set(self.postings(field, self.normalize(field, value)))
+
+    def query_terms(self, spec):
+        ids = set()
+        for field, values in spec.items():
+            if field in ('execution', 'minimum_should_match', '_cache'):
+                continue
+
+            for value in values:
+                ids |= self.postings(field, self.normalize(field, value))
+
+        return ids
+
+    def query_range(self, spec):
+        (field, bounds), = spec.items()
+
+        lower = bounds.get('gte', bounds.get('gt', bounds.get('from')))
+        upper = bounds.get('lte', bounds.get('lt', bounds.get('to')))
+        include_lower = 'gt' not in bounds and bounds.get('include_lower', True)
+        include_upper = 'lt' not in bounds and bounds.get('include_upper', True)
+
+        if lower is not None:
+            lower = self.normalize(field, lower)
+        if upper is not None:
+            upper = self.normalize(field, upper)
+
+        # Few distinct values in the fields ranged on, so walk the
+        # terms rather than the documents
+        ids = set()
+        for term, postings in self.terms.get(field, {}).items():
+            if lower is not None and (
+                    term < lower or (term == lower and not include_lower)):
+                continue
+            if upper is not None and (
+                    term > upper or (term == upper and not include_upper)):
+                continue
+            ids |= postings
+
+        return ids
+
+    def query_exists(self, spec):
+        ids = set()
+        for postings in self.terms.get(spec['field'], {}).values():
+            ids |= postings
+
+        return ids
+
+    def query_bool(self, spec):
+        def clauses(key):
+            value = spec.get(key) or []
+            return value if isinstance(value, list) else [value]
+
+        must = clauses('must') + clauses('filter')
+        should = clauses('should')
+        must_not = clauses('must_not')
+
+        ids = None
+        for clause in must:
+            matched = self.query(clause)
+            ids = matched if ids is None else ids & matched
+
+        if should:
+            matched = set()
+            for clause in should:
+                matched |= self.query(clause)
+
+            # Without a must, at least one should has to match
+            if ids is None:
+                ids = matched
+            elif spec.get('minimum_should_match'):
+                ids &= matched
+
+        if ids is None:
+            ids = self.all_ids()
+
+        for clause in must_not:
+            ids = ids - self.query(clause)
+
+        return ids
+
+    def query_filtered(self, spec):
+        ids = self.query(spec.get('query'))
+        if spec.get('filter'):
+            ids = ids & self.query(spec['filter'])
+
+        return ids
+
+    def query_constant_score(self, spec):
+        return self.query(spec.get('filter') or spec.get('query'))
+
+    # ES 1.x filter names
+
+    def query_and(self, spec):
+        return self.query_bool({'must': spec})
+
+    def query_or(self, spec):
+        return self.query_bool({'should': spec})
+
+    def query_not(self, spec):
+        return self.query_bool({'must_not': [spec]})
+
+    def query_query_string(self, spec):
+        return self.lucene(spec['query'])
+
+    def lucene(self, q):
+        """
+        Just the field:value form of the Lucene syntax
+        :param q
+        """
+
+        if ':' not in q:
+            return self.query_match({'_all': q})
+
+        field, value = q.split(':', 1)
+        return self.query_match({field: value})
+
+    def scorer(self, query):
+        """
+        Get a function scoring documents for a query. Bool queries
+        rank on the number of should clauses matched, everything
+        else scores the same.
+        :param query
+        """
+
+        # Filters don't score, only the query they wrap
+        while query and 'filtered' in query:
+            query = query['filtered'].get('query')
+
+        should = []
+        if query and 'bool' in query:
+            should = query['bool'].get('should') or []
+            if isinstance(should, dict):
+                should = [should]
+
+        if not should:
+            return lambda doc_id: 1.0
+
+        matches = [self.query(clause) for clause in should]
+
+        return lambda doc_id: 1.0 + sum(doc_id in ids for ids in matches)
+
+    def order(self, ids, query, sort, limit=None):
+        """
+        Put matching ids in result order
+        :param ids
+        :param query: for the scores
+        :param sort: (field, descending) pairs, by score if empty
+        :param limit: only the first few are needed
+        :return: list of (id, score, sort values)
+        """
+
+        score = self.scorer(query)
+
+        if not sort:
+            key = lambda doc_id: (-score(doc_id), doc_id)
+
+            if limit is None:
+                ordered = sorted(ids, key=key)
+            else:
+                # Don't sort the whole result set for the top hits
+                ordered = heapq.nsmallest(limit, ids, key=key)
+
+            return [(doc_id, score(doc_id), None) for doc_id in ordered]
+
+        def value(doc_id, field):
+            if field in ('_doc', '_id', '_uid'):
+                return doc_id
+            if field == '_score':
+                return score(doc_id)
+            return self.docs[doc_id].get(field)
+
+        # One stable sort per field, least significant first
+        ordered = list(ids)
+        for field, descending in reversed(sort):
+            ordered.sort(
+                key=lambda doc_id: value(doc_id, field),
+                reverse=descending
+            )
+
+        if limit is not None:
+            ordered = ordered[:limit]
+
+        return [
+            (doc_id, None, [value(doc_id, field) for field, _ in sort])
+            for doc_id in ordered
+        ]
+
+    #
+    # Aggregations
+    #
+
+    def aggregate(self, aggs, ids):
+        results = {}
+
+        for name, spec in aggs.items():
+            if 'terms' in spec:
+                results[name] = self.terms_agg(
+                    spec['terms'], ids,
+                    spec.get('aggs') or spec.get('aggregations')
+                )
+            elif 'min' in spec or 'max' in spec or 'sum' in spec:
+                kind = [k for k in ('min', 'max', 'sum') if k in spec][0]
+                values = [
+                    self.docs[doc_id].get(spec[kind]['field']) for doc_id in ids
+                ]
+                values = [v for v in values if v is not None]
+
+                if kind == 'sum':
+                    value = float(sum(values))
+                elif values:
+                    value = (min if kind == 'min' else max)(values)
+                else:
+                    value = None
+
+                results[name] = {'value': value}
+            else:
+                raise error(
+                    RequestError, 400,
+                    'SearchParseException[Could not find aggregator type in [%s]]' % name
+                )
+
+        return results
+
+    def terms_agg(self, spec, ids, sub_aggs=None):
+        field = spec['field']
+        size = spec.get('size', 10)
+        total = len(self.docs)
+
+        counts = []
+        for term, postings in self.terms.get(field, {}).items():
+            count = len(postings) if len(ids) == total else len(postings & ids)
+            if count:
+                counts.append((-count, term))
+
+        counts.sort()
+
+        buckets = []
+        for count, term in counts[:size or None]:
+            bucket = {'key': term, 'doc_count': -count}
+            if isinstance(term, bool):
+                bucket = {'key': int(term), 'key_as_string': str(term).lower(),
+                          'doc_count': -count}
+            if sub_aggs:
+                bucket.update(self.aggregate(
+                    sub_aggs, self.terms[field][term] & ids
+                ))
+            buckets.append(bucket)
+
+        return {
+            'doc_count_error_upper_bound': 0,
+            'sum_other_doc_count': sum(-c for c, _ in counts[len(buckets):]),
+            'buckets': buckets
+        }
+
+
+class FakeIndicesClient(object):
+    """
+    Stand-in for es.indices
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @ignorable
+    def create(self, index, body=None, **params):
+        if index in self.client.indices_by_name or index in self.client.aliases:
+            raise error(
+                RequestError, 400,
+                'IndexAlreadyExistsException[[%s] already exists]' % index
+            )
+
+        self.client.indices_by_name[index] = FakeIndex(index, body)
+        return {'acknowledged': True}
+
+    @ignorable
+    def delete(self, index, **params):
+        for name in self.client.resolve(index):
+            del self.client.indices_by_name[name]
+
+            for alias, names in self.client.aliases.items():
+                names.discard(name)
+                if not names:
+                    del self.client.aliases[alias]
+
+        return {'acknowledged': True}
+
+    def exists(self, index, **params):
+        try:
+            self.client.resolve(index)
+        except NotFoundError:
+            return False
+
+        return True
+
+    @ignorable
+    def refresh(self, index=None, **params):
+        self.client.resolve(index)
+        return {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+    @ignorable
+    def optimize(self, index=None, **params):
+        self.client.resolve(index)
+        return {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+    @ignorable
+    def put_settings(self, body, index=None, **params):
+        for name in self.client.resolve(index):
+            for key, value in loads(body).items():
+                self.client.indices_by_name[name].put_setting(key, value)
+
+        return {'acknowledged': True}
+
+    @ignorable
+    def get_settings(self, index=None, **params):
+        return dict(
+            (name, {'settings': dict(self.client.indices_by_name[name].settings)})
+            for name in self.client.resolve(index)
+        )
+
+    @ignorable
+    def get_aliases(self, index=None, **params):
+        return dict(
+            (name, {'aliases': dict(
+                (alias, {}) for alias, names in self.client.aliases.items()
+                if name in names
+            )})
+            for name in self.client.resolve(index, wildcard_ok=True)
+        )
+
+    @ignorable
+    def get_alias(self, index=None, name=None, **params):
+        names = self.client.aliases.get(name) if name else None
+        if name and not names:
+            raise error(NotFoundError, 404, 'alias [%s] missing' % name)
+
+        indices = self.get_aliases(index)
+        return dict(
+            (index_name, {'aliases': dict(
+                (alias, {}) for alias in aliases['aliases']
+                if name is None or alias == name
+            )})
+            for index_name, aliases in indices.items()
+            if name is None or name in aliases['aliases']
+        )
+
+    def exists_alias(self, index=None, name=None, **params):
+        return bool(self.client.aliases.get(name))
+
+    @ignorable
+    def update_aliases(self, body, **params):
+        aliases = self.client.aliases
+
+        for action in loads(body)['actions']:
+            (kind, spec), = action.items()
+            self.client.resolve(spec['index'])
+
+            if kind == 'add':
+                aliases.setdefault(spec['alias'], set()).add(spec['index'])
+            elif kind == 'remove':
+                names = aliases.get(spec['alias'], set())
+                names.discard(spec['index'])
+                if not names:
+                    aliases.pop(spec['alias'], None)
+
+        return {'acknowledged': True}
+
+
+class FakeElasticsearch(object):
+    """
+    In process stand-in for elasticsearch.Elasticsearch
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.indices_by_name = {}
+        self.aliases = {}
+        self.scrolls = {}
+        self.scroll_ids = itertools.count(1)
+        self.lock = threading.RLock()
+        self.indices = FakeIndicesClient(self)
+
+    def resolve(self, index=None, wildcard_ok=False):
+        """
+        Turn an index, alias, wildcard or comma separated list
+        of them into index names
+        """
+
+        names = []
+
+        for name in as_list(index) or ['_all']:
+            if name in ('_all', '*'):
+                names.extend(sorted(self.indices_by_name))
+            elif '*' in name:
+                pattern = re.compile(
+                    '^%s$' % '.*'.join(map(re.escape, name.split('*')))
+                )
+                names.extend(sorted(
+                    n for n in self.indices_by_name if pattern.match(n)
+                ))
+            elif name in self.aliases:
+                names.extend(sorted(self.aliases[name]))
+            elif name in self.indices_by_name:
+                names.append(name)
+            else:
+                raise error(
+                    NotFoundError, 404,
+                    'IndexMissingException[[%s] missing]' % name
+                )
+
+        if not names and not wildcard_ok and index not in (None, '_all'):
+            raise error(
+                NotFoundError, 404,
+                'IndexMissingException[[%s] missing]' % index
+            )
+
+        return names
+
+    def write_index(self, index):
+        """
+        The one index a write to the given name goes to,
+        creating it if need be like auto create does
+        """
+
+        if index not in self.indices_by_name and index not in self.aliases:
+            self.indices.create(index=index)
+
+        names = self.resolve(index)
+        if len(names) != 1:
+            raise error(
+                RequestError, 400,
+                'ElasticsearchIllegalArgumentException[Alias [%s] has more '
+                'than one indices associated with it]' % index
+            )
+
+        return self.indices_by_name[names[0]]
+
+    def read_index(self, index):
+        names = self.resolve(index)
+        if len(names) != 1:
+            raise error(
+                RequestError, 400,
+                'ElasticsearchIllegalArgumentException[Alias [%s] has more '
+                'than one indices associated with it]' % index
+            )
+
+        return self.indices_by_name[names[0]]
+
+    def ping(self, **params):
+        return True
+
+    def info(self, **params):
+        return {'version': {'number': '1.7.0'}, 'tagline': 'You Know, for Search'}
+
+    #
+    # Documents
+    #
+
+    @ignorable
+    @locked
+    def index(self, index, doc_type, body, id=None, op_type='index',
+              version=None, version_type=None, **params):
+        target = self.write_index(index)
+        doc_id = unicode(id) if id is not None else unicode(len(target.docs) + 1)
+
+        version, created = target.put(
+            doc_id, loads(body), op_type, version, version_type
+        )
+
+        return {
+            '_index': target.name,
+            '_type': doc_type,
+            '_id': doc_id,
+            '_version': version,
+            'created': created
+        }
+
+    @ignorable
+    def create(self, index, doc_type, body, id=None, **params):
+        return self.index(index, doc_type, body, id, op_type='create', **params)
+
+    @ignorable
+    @locked
+    def get(self, index, id, doc_type='_all', _source_include=None,
+            _source_exclude=None, _source=None, **params):
+        target = self.read_index(index)
+        doc_id = unicode(id)
+
+        if doc_id not in target.docs:
+            raise error(NotFoundError, 404, {
+                '_index': target.name, '_type': doc_type,
+                '_id': doc_id, 'found': False
+            })
+
+        response = {
+            '_index': target.name,
+            '_type': doc_type,
+            '_id': doc_id,
+            '_version': target.versions[doc_id],
+            'found': True
+        }
+
+        if _source not in (False, 'false'):
+            response['_source'] = filter_source(
+                target.docs[doc_id], _source_include, _source_exclude
+            )
+
+        return response
+
+    @ignorable
+    @locked
+    def mget(self, body, index=None, doc_type=None, _source_include=None,
+             _source_exclude=None, _source=None, **params):
+        body = loads(body)
+
+        if 'ids' in body:
+            requests = [{'_id': doc_id} for doc_id in body['ids']]
+        else:
+            requests = body['docs']
+
+        docs = []
+        for request in requests:
+            name = request.get('_index', index)
+            kind = request.get('_type', doc_type or '_all')
+
+            try:
+                docs.append(self.get(
+                    name, request['_id'], kind,
+                    _source_include=_source_include,
+                    _source_exclude=_source_exclude,
+                    _source=_source
+                ))
+            except NotFoundError:
+                docs.append({
+                    '_index': name, '_type': kind,
+                    '_id': unicode(request['_id']), 'found': False
+                })
+
+        return {'docs': docs}
+
+    @ignorable
+    def get_source(self, index, id, doc_type='_all', **params):
+        return self.get(index, id, doc_type, **params)['_source']
+
+    @locked
+    def exists(self, index, id, doc_type='_all', **params):
+        try:
+            return unicode(id) in self.read_index(index).docs
+        except NotFoundError:
+            return False
+
+    @ignorable
+    @locked
+    def update(self, index, doc_type, id, body=None, **params):
+        target = self.write_index(index)
+        doc_id = unicode(id)
+        body = loads(body) or {}
+
+        if doc_id in target.docs:
+            source = dict(target.docs[doc_id])
+            source.update(body.get('doc') or {})
+        elif body.get('doc_as_upsert'):
+            source = body['doc']
+        elif 'upsert' in body:
+            source = body['upsert']
+        else:
+            raise error(
+                NotFoundError, 404,
+                'DocumentMissingException[[%s][%s]: document missing]' % (
+                    target.name, doc_id
+                )
+            )
+
+        version, _ = target.put(doc_id, source)
+
+        return {
+            '_index': target.name,
+            '_type': doc_type,
+            '_id': doc_id,
+            '_version': version
+        }
+
+    @ignorable
+    @locked
+    def delete(self, index, doc_type, id, version=None,
+               version_type=None, **params):
+        target = self.read_index(index)
+        doc_id = unicode(id)
+
+        try:
+            version = target.delete(doc_id, version, version_type)
+        except NotFoundError:
+            raise error(NotFoundError, 404, {
+                'found': False, '_index': target.name,
+                '_type': doc_type, '_id': doc_id
+            })
+
+        return {
+            'found': True,
+            '_index': target.name,
+            '_type': doc_type,
+            '_id': doc_id,
+            '_version': version
+        }
+
+    @ignorable
+    @locked
+    def delete_by_query(self, index, doc_type=None, body=None, q=None, **params):
+        response = {'_indices': {}}
+
+        for name in self.resolve(index):
+            target = self.indices_by_name[name]
+            if q:
+                ids = target.lucene(q)
+            else:
+                ids = target.query((loads(body) or {}).get('query'))
+
+            for doc_id in ids:
+                target.delete(doc_id)
+
+            response['_indices'][name] = {
+                '_shards': {'total': 1, 'successful': 1, 'failed': 0}
+            }
+
+        return response
+
+    @ignorable
+    @locked
+    def bulk(self, body, index=None, doc_type=None, **params):
+        started = time.time()
+
+        if isinstance(body, basestring):
+            lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            lines = [loads(line) for line in body]
+
+        items = []
+        errors = False
+        i = 0
+
+        while i < len(lines):
+            (kind, meta), = lines[i].items()
+            i += 1
+
+            source = None
+            if kind != 'delete':
+                source = lines[i]
+                i += 1
+
+            target_name = meta.get('_index', index)
+            meta_type = meta.get('_type', doc_type)
+            item = {'_index': target_name, '_type': meta_type, '_id': meta.get('_id')}
+
+            try:
+                if kind in ('index', 'create'):
+                    result = self.index(
+                        target_name, meta_type, source, meta.get('_id'),
+                        op_type=kind,
+                        version=meta.get('_version'),
+                        version_type=meta.get('_version_type')
+                    )
+                    item.update(result)
+                    item['status'] = 201 if result['created'] else 200
+                elif kind == 'update':
+                    item.update(self.update(
+                        target_name, meta_type, meta['_id'], source
+                    ))
+                    item['status'] = 200
+                elif kind == 'delete':
+                    item.update(self.delete(
+                        target_name, meta_type, meta['_id'],
+                        version=meta.get('_version'),
+                        version_type=meta.get('_version_type')
+                    ))
+                    item['status'] = 200
+                else:
+                    raise error(
+                        RequestError, 400,
+                        'ActionRequestValidationException[unknown action [%s]]' % kind
+                    )
+            except TransportError as e:
+                errors = True
+                item['status'] = e.status_code
+                item['error'] = e.error
+
+                if kind == 'delete' and e.status_code == 404:
+                    item['found'] = False
+
+            items.append({kind: item})
+
+        return {
+            'took': int((time.time() - started) * 1000),
+            'errors': errors,
+            'items': items
+        }
+
+    #
+    # Search
+    #
+
+    @ignorable
+    @locked
+    def count(self, index=None, doc_type=None, body=None, q=None, **params):
+        count = 0
+
+        for name in self.resolve(index):
+            target = self.indices_by_name[name]
+            if q:
+                count += len(target.lucene(q))
+            else:
+                count += len(target.query((loads(body) or {}).get('query')))
+
+        return filter_response({
+            'count': count,
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0}
+        }, params.get('filter_path'))
+
+    def hit(self, target, doc_id, score, sort_values, doc_type, source,
+            includes, excludes):
+        hit = {
+            '_index': target.name,
+            '_type': doc_type or '_doc',
+            '_id': doc_id,
+            '_score': score,
+        }
+        if sort_values is not None:
+            hit['sort'] = sort_values
+        if source not in (False, 'false'):
+            hit['_source'] = filter_source(
+                target.docs[doc_id], includes, excludes
+            )
+
+        return hit
+
+    @ignorable
+    @locked
+    def search(self, index=None, doc_type=None, body=None, q=None,
+               size=None, from_=0, _source_include=None,
+               _source_exclude=None, _source=None, search_type=None,
+               sort=None, scroll=None, **params):
+        started = time.time()
+        body = loads(body) or {}
+
+        size = int(body.get('size', 10 if size is None else size))
+        from_ = int(body.get('from', from_ or 0))
+        if search_type == 'count':
+            size = 0
+
+        source = body.get('_source', _source)
+        if isinstance(source, dict):
+            _source_include = source.get('include', source.get('includes'))
+            _source_exclude = source.get('exclude', source.get('excludes'))
+            source = True
+        elif isinstance(source, (list, basestring)) and source not in ('true', 'false'):
+            _source_include = source
+            source = True
+
+        sort = sort_fields(body.get('sort', sort))
+
+        matches = []
+        total = 0
+        aggregations = {}
+
+        for name in self.resolve(index):
+            target = self.indices_by_name[name]
+            query = body.get('query')
+
+            if q:
+                ids = target.lucene(q)
+            else:
+                ids = target.query(query)
+
+            if body.get('aggs') or body.get('aggregations'):
+                aggregations.update(target.aggregate(
+                    body.get('aggs') or body.get('aggregations'), ids
+                ))
+
+            # A top level filter (post_filter) doesn't affect the aggregations
+            post_filter = body.get('post_filter', body.get('filter'))
+            if post_filter:
+                ids = ids & target.query(post_filter)
+
+            total += len(ids)
+
+            if not size:
+                continue
+
+            # A scroll walks all of them, otherwise only the top
+            # hits are needed
+            limit = None if scroll else from_ + size
+
+            for doc_id, score, sort_values in target.order(ids, query, sort, limit):
+                matches.append((target, doc_id, score, sort_values))
+
+        if not sort:
+            matches.sort(key=lambda match: -match[2])
+
+        hits = [
+            self.hit(owner, doc_id, score, sort_values, doc_type,
+                     source, _source_include, _source_exclude)
+            for owner, doc_id, score, sort_values
+            in matches[from_:from_ + size]
+        ]
+
+        response = {
+            'took': int((time.time() - started) * 1000),
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            'hits': {
+                'total': total,
+                'max_score': max([hit['_score'] for hit in hits] or [None]),
+                'hits': hits
+            }
+        }
+
+        if body.get('aggs') or body.get('aggregations'):
+            response['aggregations'] = aggregations
+
+        if scroll:
+            scroll_id = unicode(next(self.scroll_ids))
+            self.scrolls[scroll_id] = {
+                'matches': matches,
+                'position': from_ + size,
+                'size': size,
+                'total': total,
+                'params': (doc_type, source, _source_include, _source_exclude)
+            }
+            response['_scroll_id'] = scroll_id
+
+        return filter_response(response, params.get('filter_path'))
+
+    @ignorable
+    @locked
+    def scroll(self, scroll_id=None, body=None, scroll=None, **params):
+        if scroll_id is None:
+            scroll_id = loads(body)['scroll_id']
+
+        state = self.scrolls.get(scroll_id)
+        if state is None:
+            raise error(
+                NotFoundError, 404,
+                'SearchContextMissingException[No search context found for id [%s]]' % scroll_id
+            )
+
+        position = state['position']
+        page = state['matches'][position:position + state['size']]
+        state['position'] = position + len(page)
+
+        hits = [
+            self.hit(target, doc_id, score, sort_values, *state['params'])
+            for target, doc_id, score, sort_values in page
+        ]
+
+        return {
+            '_scroll_id': scroll_id,
+            'took': 0,
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            'hits': {
+                'total': state['total'],
+                'max_score': None,
+                'hits': hits
+            }
+        }
+
+    @ignorable
+    @locked
+    def clear_scroll(self, scroll_id=None, body=None, **params):
+        if scroll_id is None and body:
+            scroll_id = loads(body).get('scroll_id')
+
+        for scroll in as_list(scroll_id) or list(self.scrolls):
+            self.scrolls.pop(scroll, None)
+
+        return {}
+
+    @ignorable
+    @locked
+    def msearch(self, body, index=None, doc_type=None, **params):
+        if isinstance(body, basestring):
+            lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            lines = [loads(line) for line in body]
+
+        responses = []
+        for header, search in zip(lines[::2], lines[1::2]):
+            try:
+                responses.append(self.search(
+                    index=header.get('index', index),
+                    doc_type=header.get('type', doc_type),
+                    search_type=header.get('search_type'),
+                    body=search
+                ))
+            except TransportError as e:
+                responses.append({'error': e.error})
+
+        return {'responses': responses}
+
+
+# One stand-in shared by the modules that use it, so what the
+# loader indexes is there for the queries
+_client = None
+
+
+def shared_client():
+    """
+    Get the shared FakeElasticsearch, making it on first use
+    """
+
+    global _client
+
+    if _client is None:
+        _client = FakeElasticsearch()
+
+    return _client
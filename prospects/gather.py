@@ -0,0 +1,70 @@
+import threading
+from multiprocessing.pool import ThreadPool
+
+from prospects.settings import ES_SEARCH_CONCURRENCY
+
+
+# Python 2 has no asyncio, independent requests are run on a
+# shared pool of threads instead. The client's connection pool
+# is thread safe, so they reuse its persistent connections.
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    """
+    Get the shared thread pool, making it on first use
+    """
+
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(ES_SEARCH_CONCURRENCY)
+
+    return _pool
+
+
+def _call(fn):
+    return fn()
+
+
+def gather(*calls, **kwargs):
+    """
+    Run independent calls concurrently, at most limit at a time
+    :param calls: functions taking no arguments
+    :param limit: max calls in flight, the shared pool's
+        size (ES_SEARCH_CONCURRENCY) if not given
+    :return: their results, in the same order. The first
+        exception raised by a call is raised.
+    """
+
+    limit = kwargs.get('limit')
+
+    if len(calls) < 2:
+        return [call() for call in calls]
+
+    if limit is None:
+        return pool().map(_call, calls)
+
+    limited = ThreadPool(limit)
+    try:
+        return limited.map(_call, calls)
+    finally:
+        limited.terminate()
+
+
+def search_all(es, requests, limit=None):
+    """
+    Run es.search for each request concurrently
+    :param es
+    :param requests: list of es.search keyword argument dicts
+    :param limit: max searches in flight
+    :return: the responses, in the same order
+    """
+
+    return gather(*[
+        (lambda request=request: es.search(**request))
+        for request in requests
+    ], limit=limit)
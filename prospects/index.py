@@ -1,37 +1,106 @@
-from elasticsearch import Elasticsearch
+import argparse
+from collections import Counter
+from multiprocessing import Pool
 
+from elasticsearch.exceptions import TransportError
+
+from prospects.bulk import (
+    bulk_index_prospects, parallel_bulk_index_prospects, call_with_backoff
+)
+from prospects.checkpoint import Checkpoint, DeadLetters, checkpointer
+from prospects.client import es
+from prospects.mapping import (
+    create_index, begin_bulk_load, end_bulk_load
+)
+from prospects.metrics import Progress, enable_metrics, get_metrics
 from prospects.prospect import Prospect
+from prospects.rollup import (
+    count_prospects, apply_counts, reset_rollup, rollup_key,
+    create_rollup_index, rebuild_rollup
+)
 from prospects.settings import (
     ES_INDEX, ES_DOC_TYPE,
-    ES_DOC_COUNT, VERBOSE
+    ES_DOC_COUNT, VERBOSE,
+    GENERATOR_CHUNK_SIZE, ES_SYNC_MANIFEST,
+    ES_CHECKPOINT, ES_DEAD_LETTER, ES_METRICS_FILE
+)
+from prospects.sync import Manifest, reset_manifest, sync_prospects
+from prospects.versions import (
+    create_index_version, swap_alias, delete_old_versions
 )
 
 
-# Create our Elastic Search client
-es = Elasticsearch()
-
-
-def index_prospect(prospect):
+def index_prospect(prospect, index=ES_INDEX):
     """
-    Index the given Prospect in Elastic Search
+    Index the given Prospect in Elastic Search, backing off and
+    trying again while the cluster is too busy
     :param prospect
+    :param index
+    :return: whether it was indexed
     """
 
-    try:
-        if VERBOSE:
-            print prospect
-        else:
-            print '.',
+    if VERBOSE:
+        print prospect
 
-        es.index(
-            index=ES_INDEX,
+    try:
+        call_with_backoff(
+            es.index,
+            index=index,
             doc_type=ES_DOC_TYPE,
             id=prospect.id,
             body=prospect.as_dict()
         )
-    except Exception as e:
-        # Don't care for demo purposes
-        pass
+    except TransportError as e:
+        print '\nFailed %s (%s): %s' % (prospect.id, e.status_code, e.error)
+        return False
+
+    return True
+
+
+def generate_prospects(start, stop):
+    """
+    Generate Prospects for the given id range
+    :param start
+    :param stop
+    """
+
+    for id in range(start, stop):
+        yield Prospect(id)
+
+
+def generate_range(bounds):
+    """
+    Generate the Prospects for one id range, in a worker process
+    :param bounds: (start, stop) tuple
+    """
+
+    return list(generate_prospects(*bounds))
+
+
+def generate_prospects_parallel(start, stop, processes,
+                                chunk_size=GENERATOR_CHUNK_SIZE):
+    """
+    Generate Prospects for the given id range across a pool of
+    processes. Each Prospect only depends on its id, so the
+    result is the same as generate_prospects(), in the same order.
+    :param start
+    :param stop
+    :param processes
+    :param chunk_size: ids handed to a process at a time
+    """
+
+    ranges = [
+        (lo, min(lo + chunk_size, stop))
+        for lo in range(start, stop, chunk_size)
+    ]
+
+    pool = Pool(processes)
+    try:
+        for prospects in pool.imap(generate_range, ranges):
+            for prospect in prospects:
+                yield prospect
+    finally:
+        pool.terminate()
 
 
 if __name__ == "__main__":
@@ -39,23 +108,212 @@ if __name__ == "__main__":
     Test Driver
     """
 
-    # In case we had one already from a previous import
-    print 'Dropping index...'
-    es.indices.delete(index=ES_INDEX, ignore=[400, 404])
+    parser = argparse.ArgumentParser(description='Generate and index prospects')
+    parser.add_argument(
+        '--bulk', action='store_true',
+        help='Index in chunks with the _bulk API'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='Number of _bulk requests in flight (implies --bulk)'
+    )
+    parser.add_argument(
+        '--processes', type=int, default=1,
+        help='Number of processes generating prospects'
+    )
+    parser.add_argument(
+        '--start', type=int, default=1000,
+        help='First prospect id to generate, to resume a load'
+    )
+    parser.add_argument(
+        '--load-profile', action='store_true',
+        help='No refreshes or replicas while loading'
+    )
+    parser.add_argument(
+        '--force-merge', action='store_true',
+        help='Merge the index down to one segment when done'
+    )
+    parser.add_argument(
+        '--reload', action='store_true',
+        help='Load into a new %s_v<N> index, then move the alias to it' % ES_INDEX
+    )
+    parser.add_argument(
+        '--sync', action='store_true',
+        help='Only send prospects changed since the last sync, and delete '
+             'those gone'
+    )
+    parser.add_argument(
+        '--manifest', default=ES_SYNC_MANIFEST,
+        help='Where --sync keeps the hashes of what it sent'
+    )
+    parser.add_argument(
+        '--resumable', action='store_true',
+        help='Checkpoint the load, and pick up a broken one where it '
+             'stopped (implies --bulk)'
+    )
+    parser.add_argument(
+        '--checkpoint', default=ES_CHECKPOINT,
+        help='Where --resumable keeps how far the load got'
+    )
+    parser.add_argument(
+        '--dead-letter', default=ES_DEAD_LETTER,
+        help='Where --resumable writes the prospects the cluster '
+             'wouldn\'t take'
+    )
+    parser.add_argument(
+        '--metrics', nargs='?', const=ES_METRICS_FILE,
+        help='Record every Elasticsearch call, and write the histograms '
+             'here when done (.json or Prometheus text)'
+    )
+    args = parser.parse_args()
+
+    # Before the first call builds the client
+    if args.metrics:
+        enable_metrics()
+
+    if args.sync and (args.reload or args.start != 1000):
+        parser.error('--sync updates the whole index in place')
+    if args.resumable and args.sync:
+        parser.error('--sync is resumable as it is')
+
+    index = ES_INDEX
+    start, stop = args.start, ES_DOC_COUNT * 100
+
+    checkpoint = None
+    if args.resumable:
+        checkpoint = Checkpoint.load(args.checkpoint)
+    resumed = checkpoint is not None
 
-    # Create the index anew
-    print 'Creating new index...'
-    es.indices.create(index=ES_INDEX, ignore=400)
+    if resumed:
+        # Carry on with the index the broken load was writing to
+        index = checkpoint.index
+        start, stop = checkpoint.next_id, checkpoint.stop
+        print 'Resuming the load into %s from %d...' % (index, start)
 
-    # Generate and index the prospects
-    print 'Generating and indexing...'
-    for id in range(1000, ES_DOC_COUNT * 100):
-        pp = Prospect(id)
-        index_prospect(pp)
+    elif args.reload:
+        # The current index keeps serving searches meanwhile
+        index = create_index_version(es, ES_INDEX)
+        print 'Created new index %s...' % index
 
-    # Refresh the index
-    print '\n\nRefreshing the index...'
-    es.indices.refresh(index=ES_INDEX)
+        reset_manifest(args.manifest)
+
+    elif args.sync:
+        # Changes go into the index we have, if we have one
+        create_index(es, ES_INDEX)
+        create_rollup_index(es)
+
+    # Resuming adds to the index we already have
+    elif args.start == 1000:
+        # In case we had one already from a previous import
+        print 'Dropping index...'
+        es.indices.delete(index=ES_INDEX, ignore=[400, 404])
+
+        # Create the index anew
+        print 'Creating new index...'
+        create_index(es, ES_INDEX)
+
+        reset_rollup(es)
+        reset_manifest(args.manifest)
+
+    dead_letters = DeadLetters(args.dead_letter)
+
+    if args.resumable and not resumed:
+        checkpoint = Checkpoint(args.checkpoint, index, start, stop)
+        checkpoint.save()
+        dead_letters.clear()
+
+    if args.load_profile:
+        restore = begin_bulk_load(es, index)
+
+        # The broken load left the profile on, put the defaults back
+        if resumed:
+            restore = None
+
+    # Prospects loaded per rollup, added to the rollup once loaded
+    counts = Counter()
+
+    # One line for the whole load, rewritten as it goes
+    progress = Progress(stop - start)
+
+    try:
+        # Generate and index the prospects
+        print 'Generating and indexing...'
+        if args.processes > 1:
+            prospects = generate_prospects_parallel(start, stop, args.processes)
+        else:
+            prospects = generate_prospects(start, stop)
+
+        prospects = progress.track(prospects)
+
+        if args.sync:
+            manifest = Manifest.load(args.manifest)
+            try:
+                summary = sync_prospects(es, prospects, manifest, index, counts)
+            finally:
+                # Whatever was acknowledged, even if the sync broke
+                manifest.save(args.manifest)
+
+            print 'Indexed: %(indexed)s Skipped: %(skipped)s Deleted: %(deleted)s ' \
+                  'Stale: %(stale)s Failed: %(failed)s Retried: %(retried)s' % summary
+            for error in summary['errors']:
+                print 'Failed %(id)s (%(status)s): %(error)s' % error
+
+        elif args.bulk or args.workers > 1 or args.resumable:
+            prospects = count_prospects(prospects, counts)
+
+            params = {}
+            if checkpoint:
+                params['on_chunk'] = checkpointer(checkpoint, dead_letters)
+
+            if args.workers > 1:
+                summary = parallel_bulk_index_prospects(
+                    es, prospects, index, workers=args.workers, **params
+                )
+            else:
+                summary = bulk_index_prospects(es, prospects, index, **params)
+
+            print 'Indexed: %(indexed)s Failed: %(failed)s Retried: %(retried)s' % summary
+            for error in summary['errors']:
+                print 'Failed %(id)s (%(status)s): %(error)s' % error
+
+                # Prospects only depend on their id, this is the
+                # one that failed
+                counts[rollup_key(Prospect(error['id']).__dict__)] -= 1
+        else:
+            for pp in count_prospects(prospects, counts):
+                if not index_prospect(pp, index):
+                    counts[rollup_key(pp.__dict__)] -= 1
+    finally:
+        dead_letters.close()
+        progress.finish()
+
+        # Refresh the index, even if the load broke part way
+        print '\nRefreshing the index...'
+        if args.load_profile:
+            end_bulk_load(es, index, restore)
+        else:
+            es.indices.refresh(index=index)
+
+    if args.force_merge:
+        print 'Merging segments...'
+        es.indices.optimize(index=index, max_num_segments=1)
+
+    if args.reload:
+        print 'Moving alias %s to %s...' % (ES_INDEX, index)
+        swap_alias(es, index, ES_INDEX)
+
+        for name in delete_old_versions(es, ES_INDEX):
+            print 'Deleted old index %s' % name
+
+        # The counts are of the new index alone
+        reset_rollup(es)
+
+    print 'Updating the rollup...'
+    if resumed or (args.start != 1000 and not args.reload):
+        # The broken load's counts went with it, count them all again
+        rebuild_rollup(es)
+    else:
+        apply_counts(es, counts, refresh=True)
 
     # Find out how many we imported
     count = str(es.count(index=ES_INDEX)['count'])
@@ -63,3 +321,13 @@ if __name__ == "__main__":
     print 'Done.\n'
 
     print 'Imported documents: %s\n' % count
+
+    if checkpoint:
+        print 'Generated documents: %d, dead lettered: %d (%s)\n' % (
+            checkpoint.stop - checkpoint.start, checkpoint.dead, args.dead_letter
+        )
+        checkpoint.remove()
+
+    if get_metrics():
+        get_metrics().dump(args.metrics or ES_METRICS_FILE)
+        print 'Metrics written to %s' % (args.metrics or ES_METRICS_FILE)
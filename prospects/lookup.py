@@ -0,0 +1,87 @@
+from itertools import islice
+
+from prospects.settings import (
+    ES_INDEX, ES_DOC_TYPE, ES_MGET_CHUNK_SIZE
+)
+
+
+# Gets are real time, a document is found by id as soon as it's
+# indexed, refreshed or not. Refreshing is only needed to search
+# for it, so it's left to the caller.
+
+
+def chunk_ids(ids, chunk_size):
+    """
+    Split ids into lists of at most chunk_size
+    :param ids: iterable of ids
+    :param chunk_size
+    """
+
+    ids = iter(ids)
+
+    while True:
+        chunk = list(islice(ids, chunk_size))
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def iter_prospects(es, ids, index=ES_INDEX, include=None, exclude=None,
+                   chunk_size=ES_MGET_CHUNK_SIZE, refresh=False):
+    """
+    Look up prospects by id, chunk_size at a time with _mget
+    :param es
+    :param ids: iterable of ids, consumed lazily
+    :param index
+    :param include: only these source fields
+    :param exclude: not these source fields
+    :param chunk_size: ids per request
+    :param refresh: refresh the shards first, once
+    :return: (id, source) pairs in the order asked for, the
+        source is None for prospects that don't exist
+    """
+
+    params = {}
+    if include:
+        params['_source_include'] = include
+    if exclude:
+        params['_source_exclude'] = exclude
+    if refresh:
+        params['refresh'] = True
+
+    for chunk in chunk_ids(ids, chunk_size):
+        response = es.mget(
+            index=index,
+            doc_type=ES_DOC_TYPE,
+            body={'ids': chunk},
+            **params
+        )
+        params.pop('refresh', None)
+
+        # Docs come back in the order they were asked for
+        for doc_id, doc in zip(chunk, response['docs']):
+            if doc.get('found'):
+                yield doc_id, doc.get('_source', {})
+            else:
+                yield doc_id, None
+
+
+def get_prospects(es, ids, index=ES_INDEX, include=None, exclude=None,
+                  chunk_size=ES_MGET_CHUNK_SIZE, refresh=False):
+    """
+    Look up prospects by id, see iter_prospects()
+    :return: (dict of id to source, list of the ids not found)
+    """
+
+    sources = {}
+    missing = []
+
+    for doc_id, source in iter_prospects(es, ids, index, include, exclude,
+                                         chunk_size, refresh):
+        if source is None:
+            missing.append(doc_id)
+        else:
+            sources[doc_id] = source
+
+    return sources, missing
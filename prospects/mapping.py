@@ -0,0 +1,102 @@
+from prospects.settings import (
+    ES_INDEX, ES_DOC_TYPE,
+    ES_REFRESH_INTERVAL, ES_REPLICAS
+)
+
+
+# Exact value fields, not analyzed so filters and
+# terms aggregations work on the whole value
+KEYWORD = {'type': 'string', 'index': 'not_analyzed'}
+
+ES_MAPPING = {
+    ES_DOC_TYPE: {
+        'properties': {
+            'id': {'type': 'integer'},
+            'name': {'type': 'string'},
+            'email_address': {'type': 'string'},
+            'postal_code': KEYWORD,
+            'prospect_date': {'type': 'date', 'format': 'yyyy-MM-dd'},
+            'status': KEYWORD,
+            'program': KEYWORD,
+            'new_used': KEYWORD,
+            'assigned_to': KEYWORD,
+            'year': KEYWORD,
+            'make': KEYWORD,
+            'model': {'type': 'string'},
+            'certificate_id': KEYWORD,
+            'has_manual_offers': {'type': 'boolean'},
+            'has_automated_offers': {'type': 'boolean'},
+            'sold': {'type': 'boolean'},
+        }
+    }
+}
+
+
+def create_index(es, index=ES_INDEX):
+    """
+    Create the prospects index with an explicit mapping
+    :param es
+    :param index
+    """
+
+    return es.indices.create(
+        index=index,
+        body={
+            'settings': {
+                'refresh_interval': ES_REFRESH_INTERVAL,
+                'number_of_replicas': ES_REPLICAS
+            },
+            'mappings': ES_MAPPING
+        },
+        ignore=400
+    )
+
+
+def begin_bulk_load(es, index=ES_INDEX):
+    """
+    Turn off refreshes and replication while loading
+    :param es
+    :param index
+    :return: the settings to restore with end_bulk_load
+    """
+
+    response = es.indices.get_settings(index=index, flat_settings=True)
+    current = response.values()[0]['settings']
+
+    restore = {
+        'refresh_interval': current.get(
+            'index.refresh_interval', ES_REFRESH_INTERVAL
+        ),
+        'number_of_replicas': current.get(
+            'index.number_of_replicas', ES_REPLICAS
+        )
+    }
+
+    es.indices.put_settings(
+        index=index,
+        body={
+            'index': {
+                'refresh_interval': '-1',
+                'number_of_replicas': 0
+            }
+        }
+    )
+
+    return restore
+
+
+def end_bulk_load(es, index=ES_INDEX, restore=None):
+    """
+    Put refreshes and replication back after loading
+    :param es
+    :param index
+    :param restore: settings from begin_bulk_load
+    """
+
+    restore = restore or {
+        'refresh_interval': ES_REFRESH_INTERVAL,
+        'number_of_replicas': ES_REPLICAS
+    }
+
+    es.indices.put_settings(index=index, body={'index': restore})
+    es.indices.refresh(index=index)
@@ -0,0 +1,423 @@
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+from prospects.settings import ES_METRICS
+
+
+# Where the time goes in client calls. With metrics on, the shared
+# client is wrapped so every operation records into histograms:
+#
+#   latency_ms      round trip, as the caller sees it
+#   took_ms         time the cluster says it took, where it says
+#   request_bytes   body sent
+#   response_bytes  body received
+#   serialize_ms    encoding the body
+#   deserialize_ms  decoding the response
+#
+# The last four come from the client's transport, the in process
+# stand-in has none so only records the first two. With metrics
+# off the client isn't wrapped at all.
+
+# Client calls timed, everything else goes straight through
+OPERATIONS = (
+    'index', 'bulk', 'get', 'get_source', 'mget', 'exists',
+    'search', 'msearch', 'scroll', 'count', 'update', 'delete'
+)
+
+# Histogram bucket upper bounds
+MS_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+BYTES_BUCKETS = tuple(256 * 4 ** i for i in range(9))
+
+METRICS = (
+    ('latency_ms', MS_BUCKETS, 'Client round trip time'),
+    ('took_ms', MS_BUCKETS, 'Time the cluster reported taking'),
+    ('request_bytes', BYTES_BUCKETS, 'Request body size'),
+    ('response_bytes', BYTES_BUCKETS, 'Response body size'),
+    ('serialize_ms', MS_BUCKETS, 'Time encoding request bodies'),
+    ('deserialize_ms', MS_BUCKETS, 'Time decoding response bodies'),
+)
+
+# Sizes and encoding times of the call in progress, per thread
+_call = threading.local()
+
+
+class Histogram(object):
+    """
+    Counts of observations per bucket, Prometheus style
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket the q quantile falls in
+        :param q: 0 to 1
+        """
+
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return float('inf')
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(
+                (str(bound), count)
+                for bound, count in zip(self.bounds + ('+Inf',), self.counts)
+            ),
+        }
+
+
+class Metrics(object):
+    """
+    Histograms per operation and metric, plus error counts
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.errors = {}
+
+    def histogram(self, operation, metric, bounds):
+        key = (operation, metric)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(bounds)
+
+        return self.histograms[key]
+
+    def record(self, operation, values, failed=False):
+        """
+        Record one call
+        :param operation
+        :param values: dict of metric -> value, for the metrics
+            the call has
+        :param failed: the call raised
+        """
+
+        with self.lock:
+            for metric, bounds, _ in METRICS:
+                if values.get(metric) is not None:
+                    self.histogram(operation, metric, bounds).observe(values[metric])
+
+            if failed:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def as_dict(self):
+        """
+        Everything recorded, by operation then metric
+        """
+
+        with self.lock:
+            result = {}
+            for (operation, metric), histogram in self.histograms.items():
+                result.setdefault(operation, {})[metric] = histogram.as_dict()
+
+            for operation, errors in self.errors.items():
+                result.setdefault(operation, {})['errors'] = errors
+
+            return result
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True, indent=2)
+
+    def to_prometheus(self):
+        """
+        Everything recorded, in the Prometheus text format
+        """
+
+        lines = []
+
+        with self.lock:
+            for metric, bounds, description in METRICS:
+                name = 'prospects_es_%s' % metric
+                recorded = sorted(
+                    (operation, histogram)
+                    for (operation, m), histogram in self.histograms.items()
+                    if m == metric
+                )
+                if not recorded:
+                    continue
+
+                lines.append('# HELP %s %s' % (name, description))
+                lines.append('# TYPE %s histogram' % name)
+
+                for operation, histogram in recorded:
+                    cumulative = 0
+                    for bound, count in zip(bounds + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append('%s_bucket{operation="%s",le="%s"} %d' % (
+                            name, operation, bound, cumulative
+                        ))
+
+                    lines.append('%s_sum{operation="%s"} %s' % (
+                        name, operation, repr(histogram.sum)
+                    ))
+                    lines.append('%s_count{operation="%s"} %d' % (
+                        name, operation, histogram.count
+                    ))
+
+            if self.errors:
+                name = 'prospects_es_errors_total'
+                lines.append('# HELP %s Client calls that raised' % name)
+                lines.append('# TYPE %s counter' % name)
+                for operation, errors in sorted(self.errors.items()):
+                    lines.append('%s{operation="%s"} %d' % (name, operation, errors))
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """
+        Write everything recorded, as JSON for a .json path and
+        the Prometheus text format otherwise
+        :param path
+        """
+
+        with open(path, 'w') as f:
+            f.write(self.to_json() if path.endswith('.json') else self.to_prometheus())
+
+
+def _add(metric, value):
+    """
+    Add to a measurement of the call in progress, if one's timed
+    """
+
+    values = getattr(_call, 'values', None)
+    if values is not None:
+        values[metric] = values.get(metric, 0) + value
+
+
+class TimedSerializer(object):
+    """
+    Wraps the transport's serializer, timing and sizing request bodies
+    """
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+
+    def __getattr__(self, name):
+        return getattr(self.serializer, name)
+
+    def dumps(self, data):
+        started = time.time()
+        body = self.serializer.dumps(data)
+
+        _add('serialize_ms', (time.time() - started) * 1000)
+        _add('request_bytes', len(body))
+
+        return body
+
+
+class TimedDeserializer(object):
+    """
+    Wraps the transport's deserializer, timing and sizing responses
+    """
+
+    def __init__(self, deserializer):
+        self.deserializer = deserializer
+
+    def __getattr__(self, name):
+        return getattr(self.deserializer, name)
+
+    def loads(self, s, mimetype=None):
+        started = time.time()
+        data = self.deserializer.loads(s, mimetype)
+
+        _add('deserialize_ms', (time.time() - started) * 1000)
+        _add('response_bytes', len(s))
+
+        return data
+
+
+def took(response):
+    """
+    Time the cluster reported taking, the longest of an _msearch
+    """
+
+    if not isinstance(response, dict):
+        return None
+    if 'took' in response:
+        return response['took']
+    if 'responses' in response:
+        return max([r.get('took', 0) for r in response['responses']] or [None])
+
+    return None
+
+
+class InstrumentedClient(object):
+    """
+    Wraps a client, recording each of its OPERATIONS
+    """
+
+    def __init__(self, client, metrics):
+        self.client = client
+        self.metrics = metrics
+
+        transport = getattr(client, 'transport', None)
+        if transport is not None:
+            transport.serializer = TimedSerializer(transport.serializer)
+            transport.deserializer = TimedDeserializer(transport.deserializer)
+
+        for operation in OPERATIONS:
+            if hasattr(client, operation):
+                setattr(self, operation, self.timed(operation))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def timed(self, operation):
+        call = getattr(self.client, operation)
+        metrics = self.metrics
+
+        def timed_call(*args, **kwargs):
+            values = _call.values = {}
+            failed = True
+            started = time.time()
+
+            try:
+                response = call(*args, **kwargs)
+                failed = False
+            finally:
+                values['latency_ms'] = (time.time() - started) * 1000
+                _call.values = None
+
+                if not failed:
+                    values['took_ms'] = took(response)
+                metrics.record(operation, values, failed)
+
+            return response
+
+        timed_call.__name__ = operation
+        return timed_call
+
+
+_metrics = None
+
+
+def enable_metrics():
+    """
+    Turn metrics on, for clients built from now on
+    :return: the Metrics recorded into
+    """
+
+    global _metrics
+
+    if _metrics is None:
+        _metrics = Metrics()
+
+    return _metrics
+
+
+def get_metrics():
+    """
+    The Metrics recorded into, None while metrics are off
+    """
+
+    return _metrics
+
+
+def instrument(client):
+    """
+    Wrap a client if metrics are on
+    :param client
+    """
+
+    if _metrics is None:
+        return client
+
+    return InstrumentedClient(client, _metrics)
+
+
+class Progress(object):
+    """
+    Progress line rewritten in place at most every interval seconds,
+    with the rate and time left
+    """
+
+    def __init__(self, total=None, interval=1.0, label='docs', stream=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.label = label
+        self.stream = stream
+
+        self.done = 0
+        self.started = self.shown = time.time()
+
+    def add(self, n=1):
+        self.done += n
+
+        now = time.time()
+        if now - self.shown >= self.interval:
+            self.show(now)
+
+    def track(self, items):
+        """
+        Pass items through, counting them
+        :param items: iterable
+        """
+
+        for item in items:
+            yield item
+            self.add()
+
+    def show(self, now=None):
+        now = now or time.time()
+        self.shown = now
+
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.done / elapsed
+
+        line = '%d %s  %.0f %s/s  %s' % (
+            self.done, self.label, rate, self.label, format_duration(elapsed)
+        )
+        if self.total:
+            left = (self.total - self.done) / rate if rate else None
+            line = '%d/%d %s  %.0f %s/s  %s  ETA %s' % (
+                self.done, self.total, self.label, rate, self.label,
+                format_duration(elapsed), format_duration(left)
+            )
+
+        self.stream.write('\r' + line.ljust(70))
+        self.stream.flush()
+
+    def finish(self):
+        self.show()
+        self.stream.write('\n')
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '?'
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+
+if ES_METRICS:
+    enable_metrics()
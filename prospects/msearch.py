@@ -0,0 +1,119 @@
+import json
+
+from prospects import serializer
+
+
+class SearchBatch(object):
+    """
+    Collect searches and send them in one _msearch request
+
+        batch = SearchBatch(es)
+        active = batch.add(index=ES_INDEX, body={...}, size=2)
+        ...
+        batch.execute()
+        batch.result(active)['hits']['total']
+
+    Searches are added with the same keyword arguments es.search
+    takes, the ones that aren't part of the request body are
+    moved into it.
+    """
+
+    def __init__(self, es):
+        self.es = es
+        self.searches = []
+        self.responses = None
+
+    def __len__(self):
+        return len(self.searches)
+
+    def add(self, index=None, doc_type=None, body=None, q=None,
+            size=None, from_=None, _source_include=None,
+            _source_exclude=None, search_type=None, **params):
+        """
+        Register a search
+        :return: its position, to get its result with
+        """
+
+        if params:
+            raise ValueError(
+                'Parameters not supported in a batch: %s' % ', '.join(sorted(params))
+            )
+
+        header = {}
+        if index:
+            header['index'] = index
+        if doc_type:
+            header['type'] = doc_type
+        if search_type:
+            header['search_type'] = search_type
+
+        body = dict(json.loads(body) if isinstance(body, basestring) else body or {})
+
+        if q is not None:
+            body['query'] = {'query_string': {'query': q}}
+        if size is not None:
+            body['size'] = size
+        if from_ is not None:
+            body['from'] = from_
+
+        if _source_include or _source_exclude:
+            source = {}
+            if _source_include:
+                source['include'] = _source_include
+            if _source_exclude:
+                source['exclude'] = _source_exclude
+            body['_source'] = source
+
+        self.searches.append((header, body))
+        self.responses = None
+
+        return len(self.searches) - 1
+
+    def body(self):
+        """
+        The _msearch request body
+        """
+
+        return ''.join(
+            '%s\n%s\n' % (serializer.dumps(header), serializer.dumps(body))
+            for header, body in self.searches
+        )
+
+    def execute(self):
+        """
+        Send every search in one round trip
+        :return: a response per search, in the order added. A search
+            that failed gets an {'error': ...} dict instead, the
+            others aren't affected.
+        """
+
+        if not self.searches:
+            self.responses = []
+            return self.responses
+
+        response = self.es.msearch(body=self.body())
+        self.responses = response['responses']
+
+        return self.responses
+
+    def result(self, position):
+        """
+        Get one search's response
+        :param position: what add() returned
+        """
+
+        if self.responses is None:
+            self.execute()
+
+        return self.responses[position]
+
+    def errors(self):
+        """
+        The searches that failed, as (position, error) pairs
+        """
+
+        return [
+            (i, response['error'])
+            for i, response in enumerate(self.responses or [])
+            if 'error' in response
+        ]
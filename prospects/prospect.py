@@ -1,133 +1,110 @@
 import json
-import uuid
-import random
-from faker import Factory
-from faker.providers import BaseProvider
+
 from prospects.settings import FAKER_SEED
 
 
-# Create our faker
-fake = Factory.create()
-fake.seed(FAKER_SEED)
+FIELDS = (
+    'id', 'name', 'email_address', 'postal_code',
+    'prospect_date', 'status', 'program', 'new_used',
+    'assigned_to', 'year', 'make', 'model', 'certificate_id',
+    'has_manual_offers', 'has_automated_offers', 'sold'
+)
+
+# The faker, made on first use so importing this is cheap
+_fake = None
+
+
+def get_fake():
+    """
+    Get the shared faker, making it on first use
+    """
+
+    global _fake
+
+    if _fake is None:
+        from prospects.provider import create_fake
+        _fake = create_fake()
 
+    return _fake
 
-class ProspectProvider(BaseProvider):
+
+def record_seed(prospect_id):
     """
-    Create a Provider to fake Prospect data
+    Seed for a single Prospect, so its data depends only on
+    FAKER_SEED and its id, not on what was generated before it
+    :param prospect_id
     """
 
-    def status(self):
-        return random.choice([
-            'Active', 'Inactive'
-        ])
-
-    def program(self):
-        return random.choice([
-            'TrueCar', 'USAA',
-            'GEICO', 'PenFed',
-            'AAA', 'AllState',
-            'Progressive',
-            'Nationwide'
-        ])
-
-    def prospect_date(self):
-        dd = fake.date()
-        split_dd = dd.split('-')
-
-        # Replace the year with something guaranteed
-        # to be recent
-        split_dd[0] = str(
-            random.choice(['2014', '2015'])
+    return (FAKER_SEED << 32) | prospect_id
+
+
+class ProspectValues(object):
+    """
+    The values each Prospect field is drawn from
+    """
+
+    STATUSES = ('Active', 'Inactive')
+
+    PROGRAMS = (
+        'TrueCar', 'USAA',
+        'GEICO', 'PenFed',
+        'AAA', 'AllState',
+        'Progressive',
+        'Nationwide'
+    )
+
+    PROSPECT_YEARS = ('2014', '2015')
+
+    POSTAL_CODES = (
+        '90210', '90401', '90232',
+        '90832', '91495', '90090',
+        '91601', '93599', '91102',
+        '91322', '90059', '91371'
+    )
+
+    NEW_USED = ('New', 'Used')
+
+    ASSIGNED_TO = (
+        'Kris Neuharth',
+        'Chad Rempp',
+        'Eliot Shiosaki',
+        'Peter Morawiec',
+        'Priyanka Halder',
+        'Nic Walder'
+    )
+
+    YEARS = ('2014', '2015', '2016')
+
+    MAKES = ('BMW', 'MINI')
+
+    MODELS = {
+        'BMW': (
+            '2 Series',
+            '3 Series',
+            '3 Series Gran Turismo',
+            '4 Series',
+            '5 Series',
+            '5 Series Gran Turismo',
+            '6 Series',
+            '7 Series',
+            'M3', 'M4', 'M5', 'M6',
+            'X1', 'X3', 'X4', 'X5', 'X5 M', 'X6', 'X6 M',
+            'Z3', 'Z4',
+            'i3', 'i8',
+        ),
+        'MINI': (
+            "Cooper Clubman",
+            "Cooper Convertible",
+            "Cooper Countryman",
+            "Cooper Coupe",
+            "Cooper Hardtop",
+            "Cooper Hardtop 4 Door",
+            "Cooper Paceman",
+            "Cooper Roadster",
         )
+    }
 
-        return '-'.join(split_dd)
-
-    def postal_code(self):
-        return random.choice([
-            '90210', '90401', '90232',
-            '90832', '91495', '90090',
-            '91601', '93599', '91102',
-            '91322', '90059', '91371'
-
-        ])
-
-    def new_used(self):
-        return random.choice([
-            'New', 'Used'
-        ])
-
-    def assigned_to(self):
-        return random.choice([
-            'Kris Neuharth',
-            'Chad Rempp',
-            'Eliot Shiosaki',
-            'Peter Morawiec',
-            'Priyanka Halder',
-            'Nic Walder'
-        ])
-
-    def year(self):
-        return random.choice([
-            '2014', '2015', '2016'
-        ])
-
-    def make(self):
-        return random.choice([
-            'BMW',
-            'MINI'
-        ])
-
-    def model(self, make):
-
-        if make == 'BMW':
-            return random.choice([
-                '2 Series',
-                '3 Series',
-                '3 Series Gran Turismo',
-                '4 Series',
-                '5 Series',
-                '5 Series Gran Turismo',
-                '6 Series',
-                '7 Series',
-                'M3', 'M4', 'M5', 'M6',
-                'X1', 'X3', 'X4', 'X5', 'X5 M', 'X6', 'X6 M',
-                'Z3', 'Z4',
-                'i3', 'i8',
-            ])
-
-        if make == 'MINI':
-            return random.choice([
-                "Cooper Clubman",
-                "Cooper Convertible",
-                "Cooper Countryman",
-                "Cooper Coupe",
-                "Cooper Hardtop",
-                "Cooper Hardtop 4 Door",
-                "Cooper Paceman",
-                "Cooper Roadster",
-            ])
-
-    def certificate_id(self):
-        # Generate a 6 character alphanumeric string
-        return str(uuid.uuid4())[0:6].upper()
-
-    def has_manual_offers(self):
-        return random.choice([
-            True, False
-        ])
-
-    def has_automated_offers(self):
-        return random.choice([
-            True, False
-        ])
-
-    def sold(self):
-        return random.choice([
-            True, False
-        ])
-
-# Register the faker provider
-fake.add_provider(ProspectProvider)
+    FLAGS = (True, False)
 
 
 class Prospect(object):
@@ -136,6 +113,11 @@ class Prospect(object):
     """
 
     def __init__(self, prospect_id):
+        fake = get_fake()
+
+        # Reseed so any id range can be generated on its own
+        fake.seed(record_seed(prospect_id))
+
         self.id = prospect_id
         self.name = fake.name()
         self.email_address = fake.email()
@@ -156,6 +138,19 @@ class Prospect(object):
         self.has_automated_offers = fake.has_automated_offers()
         self.sold = fake.sold()
 
+    @classmethod
+    def from_source(cls, source):
+        """
+        A Prospect from its indexed source, nothing is generated
+        :param source: dict
+        """
+
+        prospect = cls.__new__(cls)
+        for field in FIELDS:
+            setattr(prospect, field, source.get(field))
+
+        return prospect
+
     def as_dict(self):
         return {
             "id": self.id,
@@ -0,0 +1,82 @@
+from faker import Factory
+from faker.providers import BaseProvider
+
+from prospects.prospect import ProspectValues
+from prospects.settings import FAKER_SEED
+
+
+# Faker takes a while to import and set up its locale, so this
+# is only imported once something is generated, see get_fake()
+
+
+class ProspectProvider(ProspectValues, BaseProvider):
+    """
+    Create a Provider to fake Prospect data
+    """
+
+    def status(self):
+        return self.random_element(self.STATUSES)
+
+    def program(self):
+        return self.random_element(self.PROGRAMS)
+
+    def prospect_date(self):
+        dd = self.generator.date()
+        split_dd = dd.split('-')
+
+        # Replace the year with something guaranteed
+        # to be recent
+        split_dd[0] = str(
+            self.random_element(self.PROSPECT_YEARS)
+        )
+
+        # Neither year is a leap year, the date field
+        # mapping rejects a Feb 29
+        if split_dd[1:] == ['02', '29']:
+            split_dd[2] = '28'
+
+        return '-'.join(split_dd)
+
+    def postal_code(self):
+        return self.random_element(self.POSTAL_CODES)
+
+    def new_used(self):
+        return self.random_element(self.NEW_USED)
+
+    def assigned_to(self):
+        return self.random_element(self.ASSIGNED_TO)
+
+    def year(self):
+        return self.random_element(self.YEARS)
+
+    def make(self):
+        return self.random_element(self.MAKES)
+
+    def model(self, make):
+        if make in self.MODELS:
+            return self.random_element(self.MODELS[make])
+
+    def certificate_id(self):
+        # Generate a 6 character alphanumeric string
+        return '%06X' % self.random_int(0, 0xFFFFFF)
+
+    def has_manual_offers(self):
+        return self.random_element(self.FLAGS)
+
+    def has_automated_offers(self):
+        return self.random_element(self.FLAGS)
+
+    def sold(self):
+        return self.random_element(self.FLAGS)
+
+
+def create_fake():
+    """
+    Create our faker, with the Prospect provider registered
+    """
+
+    fake = Factory.create()
+    fake.seed(FAKER_SEED)
+    fake.add_provider(ProspectProvider)
+
+    return fake
@@ -0,0 +1,186 @@
+from prospects.settings import ES_INDEX, ES_DOC_TYPE
+
+
+# Exact-value conditions don't need scoring. As filters they skip
+# relevance scoring and their bitsets are cached and reused by
+# later searches, so criteria compile to term/terms/range filters
+# and only clauses that rank results are left as queries.
+
+
+def criterion(field, value):
+    """
+    Compile one exact-match condition to a filter
+    :param field
+    :param value: a value to equal, a list, tuple or set to be
+        one of, or a dict of range bounds (gte, lte, gt, lt)
+    """
+
+    if isinstance(value, dict):
+        return {'range': {field: value}}
+
+    if isinstance(value, (list, tuple, set, frozenset)):
+        values = list(value)
+        if len(values) == 1:
+            return {'term': {field: values[0]}}
+
+        return {'terms': {field: values}}
+
+    return {'term': {field: value}}
+
+
+def compile_criteria(criteria):
+    """
+    Compile criteria to filters, in field order so the same
+    criteria give the same filters, and the same cache keys
+    :param criteria: dict of field to value, see criterion()
+    :return: list of filters
+    """
+
+    return [
+        criterion(field, criteria[field])
+        for field in sorted(criteria or {})
+    ]
+
+
+def prospect_query(where=None, where_not=None, should=None):
+    """
+    Build a filtered query from structured criteria
+
+        prospect_query(
+            where={'status': 'Active', 'sold': False,
+                   'prospect_date': {'gte': '2015-05-01'}},
+            where_not={'make': ['MINI', 'Saab']},
+            should=[{'match': {'model': 'X1'}}]
+        )
+
+    :param where: criteria every prospect has to meet
+    :param where_not: criteria no prospect may meet
+    :param should: scoring queries, prospects matching more of
+        them rank first but don't have to match any
+    :return: query DSL dict
+    """
+
+    must = compile_criteria(where)
+    must_not = compile_criteria(where_not)
+
+    if should:
+        # A bool with only should clauses needs one of them to
+        # match, match_all keeps them to ranking
+        query = {
+            'bool': {
+                'must': [{'match_all': {}}],
+                'should': list(should),
+            }
+        }
+    else:
+        query = {'match_all': {}}
+
+    if not must and not must_not:
+        return query
+
+    if must_not:
+        condition = {'bool': {'must': must, 'must_not': must_not}}
+    elif len(must) == 1:
+        condition = must[0]
+    else:
+        condition = {'bool': {'must': must}}
+
+    return {
+        'filtered': {
+            'query': query,
+            'filter': condition,
+        }
+    }
+
+
+# What a caller uses of a search response
+HITS = 'hits'
+TOTAL = 'total'
+AGGREGATIONS = 'aggregations'
+
+# es.search arguments that only shape the hits
+HIT_PARAMS = (
+    'size', 'from_', 'sort', '_source', '_source_include',
+    '_source_exclude', 'fields', 'scroll',
+)
+
+
+def without_hits(request):
+    """
+    es.search arguments for the same search, returning no hits,
+    so there's no fetch phase and no sources to decode
+    :param request: es.search keyword arguments
+    """
+
+    params = dict(
+        (name, value) for name, value in request.items()
+        if name not in HIT_PARAMS
+    )
+    params['size'] = 0
+
+    return params
+
+
+def count_request(request):
+    """
+    es.count arguments for the same search
+    :param request: es.search keyword arguments
+    """
+
+    params = dict(
+        (name, value) for name, value in without_hits(request).items()
+        if name != 'size'
+    )
+
+    body = params.pop('body', None)
+    if body:
+        query = body.get('query')
+
+        # _count takes no top level filter, it goes in the query
+        post_filter = body.get('post_filter', body.get('filter'))
+        if post_filter:
+            query = {'filtered': {'query': query, 'filter': post_filter}}
+
+        if query:
+            params['body'] = {'query': query}
+
+    return params
+
+
+def narrow_request(request, consumes=HITS):
+    """
+    es.search arguments asking for only what is consumed
+    :param request: es.search keyword arguments
+    :param consumes: HITS or AGGREGATIONS, see count_request()
+        for TOTAL
+    """
+
+    if consumes == HITS:
+        return request
+
+    if consumes == AGGREGATIONS:
+        params = without_hits(request)
+        params['filter_path'] = 'aggregations'
+        return params
+
+    raise ValueError('Can\'t narrow a search to %r' % consumes)
+
+
+def prospect_search_request(where=None, where_not=None, should=None,
+                            aggs=None, index=ES_INDEX, **params):
+    """
+    Build es.search keyword arguments for the prospects
+    matching some criteria, see prospect_query()
+    :param where
+    :param where_not
+    :param should
+    :param aggs: aggregations to add to the body
+    :param index
+    :param params: any other es.search arguments, size etc.
+    """
+
+    body = {'query': prospect_query(where, where_not, should)}
+    if aggs:
+        body['aggs'] = aggs
+
+    return dict(params, index=index, doc_type=ES_DOC_TYPE, body=body)
@@ -0,0 +1,391 @@
+from collections import Counter
+
+from elasticsearch.exceptions import NotFoundError
+
+from prospects.bulk import RETRY_STATUSES, send_bulk
+from prospects.mapping import KEYWORD
+from prospects import serializer
+from prospects.settings import (
+    ES_INDEX, ES_DOC_TYPE,
+    ES_ROLLUP_INDEX, ES_ROLLUP_DOC_TYPE, ES_ROLLUP_MAX_RETRIES,
+    ES_REPLICAS, ES_MGET_CHUNK_SIZE
+)
+
+
+# Prospect counts per day, make, program, new_used, postal_code and
+# sold. There are at most 768 of these a day however many prospects
+# there are, so aggregating them takes as long for a hundred million
+# prospects as for a million.
+#
+# Counts are kept up to date by adding the changes to them, read,
+# add, write back with the version read. Dynamic scripting is off
+# by default in ES 1.x, so they can't be incremented in place.
+
+# Fields a count is kept per, besides the day
+DIMENSIONS = ('make', 'program', 'new_used', 'postal_code', 'sold')
+
+# Prospect fields that decide which count it's in
+ROLLUP_FIELDS = ('prospect_date',) + DIMENSIONS
+
+ROLLUP_MAPPING = {
+    ES_ROLLUP_DOC_TYPE: {
+        'properties': {
+            'day': {'type': 'date', 'format': 'yyyy-MM-dd'},
+            'make': KEYWORD,
+            'program': KEYWORD,
+            'new_used': KEYWORD,
+            'postal_code': KEYWORD,
+            'sold': {'type': 'boolean'},
+            'count': {'type': 'long'},
+        }
+    }
+}
+
+
+def create_rollup_index(es, index=ES_ROLLUP_INDEX):
+    """
+    Create the rollup index with an explicit mapping
+    :param es
+    :param index
+    """
+
+    return es.indices.create(
+        index=index,
+        body={
+            'settings': {
+                'number_of_shards': 1,
+                'number_of_replicas': ES_REPLICAS
+            },
+            'mappings': ROLLUP_MAPPING
+        },
+        ignore=400
+    )
+
+
+def rollup_key(source):
+    """
+    The rollup a prospect is counted in
+    :param source: dict of the prospect's fields
+    :return: (day, make, program, new_used, postal_code, sold)
+    """
+
+    return (source.get('prospect_date'),) + tuple(
+        source.get(field) for field in DIMENSIONS
+    )
+
+
+def rollup_id(key):
+    return '|'.join(unicode(value) for value in key)
+
+
+def count_sources(sources, counts=None, delta=1):
+    """
+    Count prospects per rollup
+    :param sources: iterable of source dicts
+    :param counts: Counter to add to
+    :param delta: 1 to count them in, -1 to count them out
+    :return: Counter of rollup key -> change in count
+    """
+
+    if counts is None:
+        counts = Counter()
+
+    for source in sources:
+        counts[rollup_key(source)] += delta
+
+    return counts
+
+
+def count_update(old, doc):
+    """
+    How a partial update moves a prospect between rollups
+    :param old: the source before the update, None if it's new
+    :param doc: the fields updated
+    :return: Counter of rollup key -> change in count
+    """
+
+    counts = Counter()
+
+    if old is None:
+        counts[rollup_key(doc)] += 1
+        return counts
+
+    new = dict(old, **doc)
+    if rollup_key(new) != rollup_key(old):
+        counts[rollup_key(old)] -= 1
+        counts[rollup_key(new)] += 1
+
+    return counts
+
+
+def apply_counts(es, counts, index=ES_ROLLUP_INDEX,
+                 chunk_size=ES_MGET_CHUNK_SIZE,
+                 max_retries=ES_ROLLUP_MAX_RETRIES, refresh=False):
+    """
+    Add changes to the stored counts. Each count is written with
+    the version it was read at, ones changed by someone else
+    meanwhile are read and added to again.
+    :param es
+    :param counts: Counter of rollup key -> change in count
+    :param index
+    :param chunk_size: counts read and written per request
+    :param max_retries: times to retry a conflicting count
+    :param refresh: make the counts searchable straight away
+    :return: number of counts written
+    """
+
+    pending = [(key, delta) for key, delta in counts.items() if delta]
+    written = 0
+    attempt = 0
+
+    while pending:
+        conflicts = []
+
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            written_chunk, conflicting = _apply_chunk(es, chunk, index)
+
+            written += written_chunk
+            conflicts.extend(conflicting)
+
+        if conflicts and attempt >= max_retries:
+            raise RuntimeError(
+                'Rollup counts kept conflicting: %s' % ', '.join(
+                    rollup_id(key) for key, _ in conflicts[:10]
+                )
+            )
+
+        pending = conflicts
+        attempt += 1
+
+    if refresh:
+        es.indices.refresh(index=index)
+
+    return written
+
+
+def _apply_chunk(es, chunk, index):
+    """
+    Read, add to and write back one chunk of counts
+    :return: (number written, the (key, delta) pairs that conflicted)
+    """
+
+    response = es.mget(
+        index=index,
+        doc_type=ES_ROLLUP_DOC_TYPE,
+        body={'ids': [rollup_id(key) for key, _ in chunk]}
+    )
+
+    lines = []
+    sent = []
+    for (key, delta), doc in zip(chunk, response['docs']):
+        doc_id = rollup_id(key)
+
+        if doc.get('found'):
+            count = doc['_source']['count'] + delta
+            meta = {'_id': doc_id, '_version': doc['_version']}
+            action = 'index' if count > 0 else 'delete'
+        elif delta > 0:
+            count = delta
+            meta = {'_id': doc_id}
+            action = 'create'
+        else:
+            # Nothing counted there to take it from
+            continue
+
+        lines.append(serializer.dumps({action: meta}))
+        if action != 'delete':
+            source = dict(zip(('day',) + DIMENSIONS, key), count=count)
+            lines.append(serializer.dumps(source))
+
+        sent.append((key, delta))
+
+    if not sent:
+        return 0, []
+
+    response = send_bulk(
+        es,
+        '\n'.join(lines) + '\n',
+        index=index,
+        doc_type=ES_ROLLUP_DOC_TYPE
+    )
+
+    written = 0
+    conflicts = []
+    for item, pair in zip(response['items'], sent):
+        result = item.values()[0]
+        status = result.get('status', 500)
+
+        if status < 300:
+            written += 1
+        elif status == 409 or status in RETRY_STATUSES:
+            # Read again and retried, like a conflict
+            conflicts.append(pair)
+        else:
+            raise RuntimeError('Rollup count %s not written: %s' % (
+                rollup_id(pair[0]), result.get('error')
+            ))
+
+    return written, conflicts
+
+
+def count_prospects(prospects, counts):
+    """
+    Pass Prospects through, counting them per rollup on the way
+    :param prospects: iterable of Prospect
+    :param counts: Counter to add to
+    """
+
+    for prospect in prospects:
+        counts[rollup_key(prospect.__dict__)] += 1
+        yield prospect
+
+
+def reset_rollup(es, index=ES_ROLLUP_INDEX):
+    """
+    Drop all the counts
+    :param es
+    :param index
+    """
+
+    es.indices.delete(index=index, ignore=[400, 404])
+    create_rollup_index(es, index)
+
+
+def rebuild_rollup(es, index=ES_INDEX, rollup=ES_ROLLUP_INDEX):
+    """
+    Count all the prospects in an index again, from scratch
+    :param es
+    :param index: the prospects
+    :param rollup: the rollup index
+    :return: number of counts written
+    """
+
+    from prospects.export import export_prospects
+
+    sources = export_prospects(
+        es, index, fields=list(ROLLUP_FIELDS)
+    )
+    counts = count_sources(sources)
+
+    reset_rollup(es, rollup)
+    return apply_counts(es, counts, rollup, refresh=True)
+
+
+def current_source(es, doc_id, index=ES_INDEX):
+    """
+    A prospect's source as it is now, to count it out of its rollup
+    :param es
+    :param doc_id
+    :param index
+    :return: dict, None if it doesn't exist
+    """
+
+    try:
+        return es.get_source(index=index, doc_type=ES_DOC_TYPE, id=doc_id)
+    except NotFoundError:
+        return None
+
+
+def count_update_of(es, doc_id, doc, index=ES_INDEX):
+    """
+    How updating a prospect will change the counts, to be
+    called before updating it
+    :param es
+    :param doc_id
+    :param doc: the fields to update
+    :param index
+    :return: Counter of rollup key -> change in count
+    """
+
+    if not set(doc) & set(ROLLUP_FIELDS):
+        return Counter()
+
+    old = current_source(es, doc_id, index)
+    if old is None:
+        return Counter()
+
+    return count_update(old, doc)
+
+
+def rollup_aggregations(es, fields, sold=None, date_from=None, date_to=None,
+                        size=10, index=ES_ROLLUP_INDEX):
+    """
+    Count prospects per value of some fields from the rollup. The
+    same as terms aggregations over the prospects themselves.
+    :param es
+    :param fields: any of DIMENSIONS
+    :param sold: only prospects sold, or not, if given
+    :param date_from: first prospect_date, inclusive
+    :param date_to: last prospect_date, inclusive
+    :param size: buckets per field
+    :param index
+    :return: dict of field -> terms aggregation result
+    """
+
+    filters = []
+    if sold is not None:
+        filters.append({'term': {'sold': sold}})
+    if date_from or date_to:
+        bounds = {}
+        if date_from:
+            bounds['gte'] = date_from
+        if date_to:
+            bounds['lte'] = date_to
+        filters.append({'range': {'day': bounds}})
+
+    query = {'match_all': {}}
+    if filters:
+        query = {
+            'filtered': {
+                'query': query,
+                'filter': {'bool': {'must': filters}}
+            }
+        }
+
+    # Every bucket, they're few. Ordered here by the summed counts,
+    # the same way the terms aggregation orders doc counts.
+    aggs = dict(
+        (field, {
+            'terms': {'field': field, 'size': 0},
+            'aggs': {'count': {'sum': {'field': 'count'}}}
+        })
+        for field in fields
+    )
+
+    response = es.search(
+        index=index,
+        doc_type=ES_ROLLUP_DOC_TYPE,
+        body={'query': query, 'aggs': aggs},
+        size=0
+    )
+
+    results = {}
+    for field in fields:
+        buckets = [
+            {'key': bucket['key'], 'doc_count': int(bucket['count']['value'])}
+            for bucket in response['aggregations'][field]['buckets']
+        ]
+        buckets = [bucket for bucket in buckets if bucket['doc_count']]
+        buckets.sort(key=lambda bucket: (-bucket['doc_count'], bucket['key']))
+
+        results[field] = {
+            'doc_count_error_upper_bound': 0,
+            'sum_other_doc_count': sum(
+                bucket['doc_count'] for bucket in buckets[size:]
+            ),
+            'buckets': buckets[:size]
+        }
+
+    return results
+
+
+if __name__ == "__main__":
+    """
+    Rebuild Driver
+    """
+
+    from prospects.client import es
+
+    print 'Counting prospects into %s...' % ES_ROLLUP_INDEX
+    print 'Wrote %d counts' % rebuild_rollup(es)
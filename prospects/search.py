@@ -1,14 +1,31 @@
-from elasticsearch import Elasticsearch
+from functools import partial
+
+from prospects.cache import QueryCache
+from prospects.client import es
+from prospects.export import export_prospects
+from prospects.gather import gather
+from prospects.lookup import get_prospects
+from prospects.msearch import SearchBatch
 from prospects.prospect import Prospect
+from prospects.rollup import (
+    apply_counts, count_sources, count_update_of, current_source,
+    rollup_aggregations, ROLLUP_FIELDS
+)
+from prospects.query import (
+    HITS, TOTAL, AGGREGATIONS,
+    prospect_search_request, count_request, narrow_request, without_hits
+)
+from prospects.metrics import get_metrics
+from prospects.writer import ProspectWriter
 from prospects.settings import (
-    ES_INDEX, ES_DOC_TYPE
+    ES_INDEX, ES_DOC_TYPE, ES_METRICS_FILE
 )
 
 import json
 
 
-# Create our Elastic Search client
-es = Elasticsearch()
+# Cache search responses, the writes below clear it
+cache = QueryCache()
 
 
 # http://elasticsearch-py.readthedocs.org/en/latest/api.html
@@ -29,6 +46,28 @@ def print_r(msg, response):
     )
 
 
+def count_search(**kwargs):
+    """
+    es.count, answered like a search with only the total
+    """
+
+    return {'hits': {'total': es.count(**kwargs)['count']}}
+
+
+def cached_search(consumes=HITS, **kwargs):
+    """
+    es.search, through the result cache
+    :param consumes: what is used of the response, HITS, TOTAL
+        or AGGREGATIONS. For the last two the hits aren't fetched,
+        and a total is counted with _count.
+    """
+
+    if consumes == TOTAL:
+        return cache.call(count_search, **count_request(kwargs))
+
+    return cache.call(es.search, **narrow_request(kwargs, consumes))
+
+
 def create_prospect():
     """
     Create a prospect in the index
@@ -44,6 +83,9 @@ def create_prospect():
         refresh=True
     )
 
+    cache.invalidate(ES_INDEX)
+    apply_counts(es, count_sources([prospect.as_dict()]), refresh=True)
+
     print_r('Created', response)
 
 
@@ -60,6 +102,10 @@ def update_prospect():
         }
     }
     '''
+
+    # Read before it changes, if it moves between rollups
+    counts = count_update_of(es, 111, json.loads(body)['doc'])
+
     response = es.update(
         index=ES_INDEX,
         doc_type=ES_DOC_TYPE,
@@ -68,6 +114,9 @@ def update_prospect():
         refresh=True
     )
 
+    cache.invalidate(ES_INDEX)
+    apply_counts(es, counts, refresh=True)
+
     print_r('Updated', response)
 
 
@@ -79,8 +128,7 @@ def get_prospect_by_id():
     response = es.get(
         index=ES_INDEX,
         doc_type=ES_DOC_TYPE,
-        id=111,
-        refresh=True
+        id=111
     )
 
     print_r('Get Prospect By ID', response)
@@ -102,8 +150,7 @@ def get_prospect_by_id_exclude_fields():
             'has_manual_offers', 'has_automated_offers',
             'sold'
         ],
-        id=111,
-        refresh=True
+        id=111
     )
 
     print_r('Get Prospect By ID, Exclude Fields', response)
@@ -120,8 +167,7 @@ def get_prospect_by_id_include_fields():
         _source_include=[
             'name', 'email_address'
         ],
-        id=111,
-        refresh=True
+        id=111
     )
 
     print_r('Get Prospect By ID, Include Fields', response)
@@ -135,8 +181,7 @@ def get_prospect_source_by_id():
     response = es.get_source(
         index=ES_INDEX,
         doc_type=ES_DOC_TYPE,
-        id=111,
-        refresh=True
+        id=111
     )
 
     print_r('Get Prospect Source By ID', response)
@@ -158,8 +203,7 @@ def get_prospect_source_by_id_exclude_fields():
             'has_manual_offers', 'has_automated_offers',
             'sold'
         ],
-        id=111,
-        refresh=True
+        id=111
     )
 
     print_r('Get Prospect Source By ID, Exclude Fields', response)
@@ -176,8 +220,7 @@ def get_prospect_source_by_id_include_fields():
         _source_include=[
             'name', 'email_address'
         ],
-        id=111,
-        refresh=True
+        id=111
     )
 
     print_r('Get Prospect Source By ID, Include Fields', response)
@@ -188,6 +231,9 @@ def delete_prospect_by_id():
     Delete a prospect by id
     """
 
+    # What to count out of the rollup
+    old = current_source(es, 111)
+
     response = es.delete(
         index=ES_INDEX,
         doc_type=ES_DOC_TYPE,
@@ -195,26 +241,54 @@ def delete_prospect_by_id():
         refresh=True
     )
 
+    cache.invalidate(ES_INDEX)
+    if old:
+        apply_counts(es, count_sources([old], delta=-1), refresh=True)
+
     print_r('Deleted', response)
 
 
+def reassign_prospects():
+    """
+    Reassign many prospects, refreshing once at the end
+    """
+
+    with ProspectWriter(es) as writer:
+        for id in range(1000, 1100):
+            writer.update(id, {'assigned_to': 'Kris Neuharth'})
+
+        # Doesn't exist, reported as a failure
+        writer.update(111, {'assigned_to': 'Kris Neuharth'})
+
+    # assigned_to isn't rolled up, the counts stay the same
+    cache.invalidate(ES_INDEX)
+
+    print_r('Reassigned', writer.summary)
+
+
 def delete_prospects_by_query():
     """
     Delete prospects that match a query
     """
 
+    query = {
+        'term': {
+            'email_address': 'kneuharth@truecar.com'
+        }
+    }
+
+    # What to count out of the rollup
+    old = list(export_prospects(es, query=query, fields=list(ROLLUP_FIELDS)))
+
     response = es.delete_by_query(
         index=ES_INDEX,
         doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'term': {
-                    'email_address': 'kneuharth@truecar.com'
-                }
-            }
-        },
+        body={'query': query},
     )
 
+    cache.invalidate(ES_INDEX)
+    apply_counts(es, count_sources(old, delta=-1), refresh=True)
+
     print_r('Deleted By Query', response)
 
 
@@ -227,163 +301,181 @@ def prospect_exists():
     response = es.exists(
         index=ES_INDEX,
         doc_type=ES_DOC_TYPE,
-        id=111,
-        refresh=True
+        id=111
     )
 
     print_r('Prospect Exists', response)
 
 
+def get_prospects_by_ids():
+    """
+    Get many prospects by id, in as few requests as possible
+    """
+
+    sources, missing = get_prospects(
+        es,
+        [111] + range(1000, 1010),
+        include=['name', 'email_address']
+    )
+
+    print_r('Get Prospects By IDs', sources)
+    print_r('Not Found', missing)
+
+
+# Match all
+ALL_PROSPECTS_SEARCH = dict(
+    index=ES_INDEX,
+    doc_type=ES_DOC_TYPE,
+    body={
+        'query': {
+            'match_all': {}
+        }
+    },
+    # Limit the number of results
+    size=2,
+    _source_include=[
+        'status', 'name', 'email_address'
+    ],
+)
+
+
 def get_all_prospects():
     """
     Get all prospects
     """
 
-    # Match all
-    response = es.search(
-        index=ES_INDEX,
-        doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'match_all': {}
-            }
-        },
-        # Limit the number of results
-        size=2,
-        _source_include=[
-            'status', 'name', 'email_address'
-        ],
-    )
+    response = cached_search(TOTAL, **ALL_PROSPECTS_SEARCH)
 
     print_r('Count', response['hits']['total'])
 
 
+# Term filter
+ACTIVE_PROSPECTS_SEARCH = prospect_search_request(
+    where={'status': 'Active'},
+    # Limit the number of results
+    size=2,
+    _source_include=[
+        'status', 'name', 'email_address'
+    ],
+)
+
+
 def get_all_active_prospects():
     """
     Get all active prospects
     """
 
-    # Match
-    response = es.search(
-        index=ES_INDEX,
-        doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'match': {'status': 'Active'}
-            }
-        },
-        # Limit the number of results
-        size=2,
-        _source_include=[
-            'status', 'name', 'email_address'
-        ],
-    )
+    response = cached_search(TOTAL, **ACTIVE_PROSPECTS_SEARCH)
 
     print_r('Count', response['hits']['total'])
 
 
+# Match Phrase
+BMW_THREE_SERIES_SEARCH = dict(
+    index=ES_INDEX,
+    doc_type=ES_DOC_TYPE,
+    body={
+        'query': {
+            'match_phrase': {'model': '3 Series'}
+        }
+    },
+    # Limit the number of results
+    size=2,
+    _source_include=[
+        'status', 'name', 'email_address'
+    ],
+)
+
+
 def get_prospects_bmw_three_series():
     """
     Get all prospects looking for a 3 Series
     """
 
-    # Match Phrase
-    response = es.search(
-        index=ES_INDEX,
-        doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'match_phrase': {'model': '3 Series'}
-            }
-        },
-        # Limit the number of results
-        size=2,
-        _source_include=[
-            'status', 'name', 'email_address'
-        ],
-    )
+    response = cached_search(TOTAL, **BMW_THREE_SERIES_SEARCH)
 
     print_r('Count', response['hits']['total'])
 
 
+# Match all, filtered to May
+ACTIVE_IN_DATE_RANGE_SEARCH = prospect_search_request(
+    where={
+        'prospect_date': {'gte': '2015-05-01', 'lte': '2015-05-30'}
+    },
+    # Limit the number of results
+    size=2,
+    _source_include=[
+        'status', 'name', 'email_address'
+    ],
+)
+
+
 def filter_active_in_date_range():
     """
     Find all the prospects in May
     """
 
-    response = es.search(
-        index=ES_INDEX,
-        doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'match_all': {}
-            },
-            'filter': {
-                'range': {
-                    'prospect_date': {
-                        'from': '2015-05-01',
-                        'to': '2015-05-30'
-                    }
-                }
-            }
-        },
-        # Limit the number of results
-        size=2,
-        _source_include=[
-            'status', 'name', 'email_address'
-        ],
-    )
+    response = cached_search(**ACTIVE_IN_DATE_RANGE_SEARCH)
 
     print_r('Found', response)
     print_r('Count', response['hits']['total'])
 
 
+def prospect_counts():
+    """
+    Get the counts of the searches above, in one round trip
+    """
+
+    batch = SearchBatch(es)
+
+    # Only the totals are used
+    searches = [
+        ('All', batch.add(**without_hits(ALL_PROSPECTS_SEARCH))),
+        ('Active', batch.add(**without_hits(ACTIVE_PROSPECTS_SEARCH))),
+        ('3 Series', batch.add(**without_hits(BMW_THREE_SERIES_SEARCH))),
+        ('In May', batch.add(**without_hits(ACTIVE_IN_DATE_RANGE_SEARCH))),
+    ]
+
+    batch.execute()
+
+    for label, position in searches:
+        response = batch.result(position)
+
+        if 'error' in response:
+            print_r('%s Failed' % label, response['error'])
+        else:
+            print_r('%s Count' % label, response['hits']['total'])
+
+
+# Filtered to May, sold and BMW
+SOLD_BMW_IN_MAY_SEARCH = prospect_search_request(
+    where={
+        'sold': True,
+        'make': 'BMW',
+        'prospect_date': {'gte': '2015-05-01', 'lte': '2015-05-30'}
+    },
+    # Limit the number of results
+    size=2,
+    _source_include=[
+        'status', 'name', 'email_address'
+    ],
+)
+
+
 def filter_date_range_query_sold_make():
     """
     Find all the prospects in May, who bought BMWs
     """
-    response = es.search(
-        index=ES_INDEX,
-        doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'filtered': {
-                    'query': {
-                        'bool': {
-                            'must': [
-                                {'match': {'sold': True}},
-                                {'match': {'make': 'BMW'}},
-                            ]
-                        }
-                    },
-                    'filter': {
-                        'range': {
-                            'prospect_date': {
-                                'gte': '2015-05-01',
-                                'lte': '2015-05-30'
-                            }
-                        }
-                    }
-                }
-            }
-        },
-        # Limit the number of results
-        size=2,
-        _source_include=[
-            'status', 'name', 'email_address'
-        ],
-    )
+    response = cached_search(**SOLD_BMW_IN_MAY_SEARCH)
 
     print_r('Found:', response)
     print_r('Count:', response['hits']['total'])
 
-def prospect_search():
-    """
-    Find prospects by query
-    """
-
+# The searches prospect_search() runs, they don't depend
+# on each other so they're sent together
+PROSPECT_SEARCHES = [
     # Lucene syntax
-    response = es.search(
+    dict(
         index=ES_INDEX,
         doc_type=ES_DOC_TYPE,
         q='status:Active',
@@ -392,119 +484,76 @@ def prospect_search():
         _source_include=[
             'status', 'name', 'email_address'
         ],
-    )
-
-    print_r('Found', response)
-    print_r('Count', response['hits']['total'])
+    ),
 
     # DSL syntax
-    response = es.search(
-        index=ES_INDEX,
-        doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'match': {'status': 'Active'}
-            }
+    ACTIVE_PROSPECTS_SEARCH,
+
+    # Find something more complicated, only the model
+    # affects the ranking
+    prospect_search_request(
+        where={
+            'status': 'Active',
+            'sold': False,
+            'new_used': 'New',
+            'has_manual_offers': True,
+            'has_automated_offers': True,
         },
-        # Limit the number of results
-        size=2,
-        _source_include=[
-            'status', 'name', 'email_address'
-        ],
-    )
-
-    print_r('Found', response)
-    print_r('Count', response['hits']['total'])
-
-    # Find something more complicated
-    response = es.search(
-        index=ES_INDEX,
-        doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'bool': {
-                    'must': [
-                        {'match': {'status': 'Active'}},
-                        {'match': {'sold': False}},
-                        {'match': {'new_used': 'New'}},
-                        {'match': {'has_manual_offers': True}},
-                        {'match': {'has_automated_offers': True}},
-                    ],
-                    'must_not': [
-                        {'match': {'make': 'MINI'}},
-                        {'match': {'year': '2015'}}
-                    ],
-                    'should': [
-                        {'match': {'model': 'X1'}},
-                        {'match': {'model': 'X3'}}
-                    ]
-                }
-            }
+        where_not={
+            'make': 'MINI',
+            'year': '2015',
         },
+        should=[
+            {'match': {'model': 'X1'}},
+            {'match': {'model': 'X3'}}
+        ],
         # Limit the number of results
         size=2,
         _source_include=[
             'status', 'name', 'email_address'
         ],
-    )
-
-    print_r('Found', response)
-    print_r('Count', response['hits']['total'])
+    ),
 
     # Find all the prospects in May
-    response = es.search(
-        index=ES_INDEX,
-        doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'range': {
-                    'prospect_date': {
-                        'from': '2015-05-01',
-                        'to': '2015-05-30'
-                    }
-                }
-            }
+    prospect_search_request(
+        where={
+            'prospect_date': {'gte': '2015-05-01', 'lte': '2015-05-30'}
         }
-    )
-
-    print_r('Found', response)
-    print_r('Count', response['hits']['total'])
+    ),
 
     # Find all the prospects in May, who bought BMWs
-    response = es.search(
-        index=ES_INDEX,
-        doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'filtered': {
-                    'query': {
-                        'bool': {
-                            'must': [
-                                {'match': {'sold': True}},
-                                {'match': {'make': 'BMW'}},
-                            ]
-                        }
-                    },
-                    'filter': {
-                        'range': {
-                            'prospect_date': {
-                                'gte': '2015-05-01',
-                                'lte': '2015-05-30'
-                            }
-                        }
-                    }
-                }
-            }
-        },
-        # Limit the number of results
-        size=2,
-        _source_include=[
-            'status', 'name', 'email_address'
-        ],
-    )
+    SOLD_BMW_IN_MAY_SEARCH,
+]
 
-    print_r('Found:', response)
-    print_r('Count:', response['hits']['total'])
+
+def prospect_search():
+    """
+    Find prospects by query
+    """
+
+    # Takes about as long as the slowest search, not all of them
+    responses = gather(*[
+        partial(cached_search, **request)
+        for request in PROSPECT_SEARCHES
+    ])
+
+    for response in responses:
+        print_r('Found', response)
+        print_r('Count', response['hits']['total'])
+
+
+SOLD_IN_MAY_AGGREGATIONS_SEARCH = prospect_search_request(
+    where={
+        'sold': True,
+        'prospect_date': {'gte': '2015-05-01', 'lte': '2015-05-30'}
+    },
+    aggs={
+        'per_make': {'terms': {'field': 'make'}},
+        'per_program': {'terms': {'field': 'program'}},
+        'per_new_used': {'terms': {'field': 'new_used'}},
+        'per_postal_code': {'terms': {'field': 'postal_code'}},
+    }
+)
 
 
 def prospect_search_with_aggregations():
@@ -512,37 +561,7 @@ def prospect_search_with_aggregations():
     Get all the prospects in May who bought cars,
     get stats using aggregations
     """
-    response = es.search(
-        index=ES_INDEX,
-        doc_type=ES_DOC_TYPE,
-        body={
-            'query': {
-                'filtered': {
-                    'query': {
-                        'bool': {
-                            'must': [
-                                {'match': {'sold': True}}
-                            ]
-                        }
-                    },
-                    'filter': {
-                        'range': {
-                            'prospect_date': {
-                                'gte': '2015-05-01',
-                                'lte': '2015-05-30'
-                            }
-                        }
-                    }
-                }
-            },
-            'aggs': {
-                'per_make': {'terms': {'field': 'make'}},
-                'per_program': {'terms': {'field': 'program'}},
-                'per_new_used': {'terms': {'field': 'new_used'}},
-                'per_postal_code': {'terms': {'field': 'postal_code'}},
-            }
-        }
-    )
+    response = cached_search(AGGREGATIONS, **SOLD_IN_MAY_AGGREGATIONS_SEARCH)
 
     print_r('Year Buckets', response['aggregations']['per_make'])
     print_r('Program Buckets', response['aggregations']['per_program'])
@@ -550,6 +569,26 @@ def prospect_search_with_aggregations():
     print_r('Postal Code Buckets', response['aggregations']['per_postal_code'])
 
 
+def prospect_rollup_aggregations():
+    """
+    The same stats as prospect_search_with_aggregations(), from
+    the rollup instead of every prospect
+    """
+
+    buckets = rollup_aggregations(
+        es,
+        ['make', 'program', 'new_used', 'postal_code'],
+        sold=True,
+        date_from='2015-05-01',
+        date_to='2015-05-30'
+    )
+
+    print_r('Year Buckets', buckets['make'])
+    print_r('Program Buckets', buckets['program'])
+    print_r('New/Used Buckets', buckets['new_used'])
+    print_r('Postal Code Buckets', buckets['postal_code'])
+
+
 if __name__ == "__main__":
     """
     Test Driver
@@ -589,12 +628,18 @@ if __name__ == "__main__":
     # See if the doc exists now
     prospect_exists()
 
+    # Get many docs at once
+    get_prospects_by_ids()
+
     # Delete the doc by id
     delete_prospect_by_id()
 
     # Delete docs matching a query
     delete_prospects_by_query()
 
+    # Change many docs at once
+    reassign_prospects()
+
     # Find some prospects
     prospect_search()
 
@@ -604,5 +649,15 @@ if __name__ == "__main__":
 
     filter_active_in_date_range()
 
+    # The counts again, in one request
+    prospect_counts()
+
     # Find some prospects, with additional aggregations
     prospect_search_with_aggregations()
+
+    # The same, from the rollup
+    prospect_rollup_aggregations()
+
+    if get_metrics():
+        get_metrics().dump(ES_METRICS_FILE)
+        print 'Metrics written to %s' % ES_METRICS_FILE
@@ -0,0 +1,160 @@
+import json
+
+from prospects.prospect import FIELDS
+from prospects.settings import (
+    ES_INDEX, ES_DOC_TYPE
+)
+
+
+# Use the fastest JSON encoder available, plain json otherwise
+try:
+    import ujson as backend
+except ImportError:
+    try:
+        import simplejson as backend
+    except ImportError:
+        backend = json
+
+dumps = backend.dumps
+
+
+def set_backend(module):
+    """
+    Swap the JSON backend, anything with a json.dumps
+    compatible dumps() will do. Other modules call
+    serializer.dumps() so they see the swap.
+    :param module
+    """
+
+    global backend, dumps
+
+    backend = module
+    dumps = module.dumps
+
+
+def encode_prospect(prospect):
+    """
+    Encode a Prospect's source, its FIELDS and nothing else
+    :param prospect
+    """
+
+    return dumps(dict((field, getattr(prospect, field)) for field in FIELDS))
+
+
+def encode_id(doc_id):
+    """
+    Encode a document id for an action line, always as a string
+    :param doc_id
+    """
+
+    return json.dumps(unicode(doc_id))
+
+
+def prospect_sources(prospects):
+    """
+    Turn Prospects into (id, encoded source) pairs
+    :param prospects: iterable of Prospect
+    """
+
+    for prospect in prospects:
+        yield prospect.id, encode_prospect(prospect)
+
+
+class BulkChunk(object):
+    """
+    A finished _bulk request body, with where each item lives in it
+    """
+
+    def __init__(self, ids, offsets, body):
+        self.ids = ids
+        self.offsets = offsets
+        self.body = body
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lines(self, i):
+        """
+        The action and source lines of item i
+        :param i
+        """
+
+        return self.body[self.offsets[i]:self.offsets[i + 1]]
+
+    def subset(self, items):
+        """
+        A new chunk with only the given items
+        :param items: item positions
+        """
+
+        ids, offsets, parts = [], [0], []
+
+        for i in items:
+            lines = self.lines(i)
+            ids.append(self.ids[i])
+            parts.append(lines)
+            offsets.append(offsets[-1] + len(lines))
+
+        return BulkChunk(ids, offsets, ''.join(parts))
+
+
+class BulkBuffer(object):
+    """
+    Reusable buffer that _bulk action and source lines are
+    written straight into
+    """
+
+    def __init__(self, index=ES_INDEX, doc_type=ES_DOC_TYPE, version=None):
+        self.buffer = bytearray()
+        self.ids = []
+        self.offsets = [0]
+
+        # Everything in the action line but the id is fixed
+        self.action = '{"index":{"_index":%s,"_type":%s,"_id":' % (
+            json.dumps(index), json.dumps(doc_type)
+        )
+
+        # Every document written with the same external version
+        self.action_end = '}}\n'
+        if version is not None:
+            self.action_end = ',"_version":%d,"_version_type":"external"}}\n' % (
+                version
+            )
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return len(self.buffer)
+
+    def add(self, doc_id, source):
+        """
+        Write one document
+        :param doc_id
+        :param source: encoded JSON source
+        """
+
+        buffer = self.buffer
+        buffer += self.action
+        buffer += encode_id(doc_id)
+        buffer += self.action_end
+        buffer += source
+        buffer += '\n'
+
+        self.ids.append(doc_id)
+        self.offsets.append(len(buffer))
+
+    def take(self):
+        """
+        Get the buffered documents as a BulkChunk and empty
+        the buffer for reuse
+        """
+
+        chunk = BulkChunk(self.ids, self.offsets, str(self.buffer))
+
+        del self.buffer[:]
+        self.ids = []
+        self.offsets = [0]
+
+        return chunk
@@ -5,4 +5,78 @@ ES_INDEX = 'prospects'
 ES_DOC_TYPE = 'prospect'
 ES_DOC_COUNT = 1000
 
-VERBOSE = False
\ No newline at end of file
+# Use the in process stand-in instead of a cluster
+ES_FAKE = False
+
+# Client, shared by everything in the process
+ES_HOSTS = ['localhost:9200']
+ES_POOL_SIZE = 16
+ES_TIMEOUT = 30
+ES_MAX_RETRIES = 3
+ES_RETRY_ON_TIMEOUT = True
+ES_SNIFF = False
+ES_SNIFF_INTERVAL = 60
+
+# Gzip request bodies and accept gzipped responses, fewer
+# bytes on the wire for more CPU
+ES_HTTP_COMPRESS = False
+
+# Prospect ids generated per process task
+GENERATOR_CHUNK_SIZE = 1000
+
+# Distinct name/email pairs used by batch generation
+BATCH_NAME_POOL_SIZE = 10000
+
+# Index settings, restored after a bulk load
+ES_REFRESH_INTERVAL = '1s'
+ES_REPLICAS = 1
+
+# Pre-aggregated prospect counts, see rollup.py
+ES_ROLLUP_INDEX = 'prospects_rollup'
+ES_ROLLUP_DOC_TYPE = 'rollup'
+ES_ROLLUP_MAX_RETRIES = 5
+
+# Old prospects_v<N> indices kept around after a reload
+ES_KEEP_VERSIONS = 1
+
+# Bulk indexing
+ES_BULK_CHUNK_SIZE = 500
+ES_BULK_MAX_CHUNK_BYTES = 5 * 1024 * 1024
+ES_BULK_MAX_RETRIES = 3
+ES_BULK_WORKERS = 4
+
+# Waits before resending what the cluster turned down, in seconds,
+# doubling from the first up to the longest
+ES_BULK_BACKOFF = 0.5
+ES_BULK_MAX_BACKOFF = 30
+
+# Resumable loads, see checkpoint.py
+ES_CHECKPOINT = 'prospects.checkpoint.json'
+ES_DEAD_LETTER = 'prospects.dead.ndjson'
+
+# Hashes of the prospects last synced, see sync.py
+ES_SYNC_MANIFEST = 'prospects.manifest.npz'
+
+# Buffered writes are sent at least this often, in seconds
+ES_WRITER_FLUSH_INTERVAL = 5
+
+# Independent searches in flight at once
+ES_SEARCH_CONCURRENCY = 8
+
+# Ids looked up per _mget request
+ES_MGET_CHUNK_SIZE = 500
+
+# Export, id ranges scrolled in parallel
+ES_EXPORT_SLICES = 4
+ES_EXPORT_PAGE_SIZE = 1000
+
+# search.py result cache, 0 entries turns it off
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_TTL = 60
+
+# Record every client call, see metrics.py. Written out when a
+# driver finishes, as JSON for a .json file, Prometheus text otherwise
+ES_METRICS = False
+ES_METRICS_FILE = 'prospects.metrics.prom'
+
+VERBOSE = False
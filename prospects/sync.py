@@ -0,0 +1,319 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from prospects.bulk import chunk_sources, send_chunk
+from prospects.lookup import chunk_ids, iter_prospects
+from prospects.rollup import ROLLUP_FIELDS, count_sources
+from prospects.serializer import BulkChunk, encode_prospect
+from prospects.settings import (
+    ES_INDEX, ES_DOC_TYPE,
+    ES_BULK_CHUNK_SIZE, ES_BULK_MAX_CHUNK_BYTES, ES_BULK_MAX_RETRIES,
+    ES_SYNC_MANIFEST
+)
+
+
+# Incremental loads. A manifest on disk holds a hash of every
+# prospect's source as last sent. A sync hashes the prospects again
+# and only sends the ones whose hash changed, then deletes the ones
+# no longer generated.
+#
+# Every write in a sync carries the sync's generation as an external
+# version. Generations only go up, so a write replayed from an
+# earlier sync, or racing a later one, is turned down by the cluster
+# with a 409 instead of overwriting newer data.
+
+
+def source_hash(source):
+    """
+    64 bit hash of an encoded source
+    :param source
+    """
+
+    return int(hashlib.md5(source).hexdigest()[:16], 16)
+
+
+class Manifest(object):
+    """
+    Sorted arrays of prospect ids and the hashes of their
+    sources, as last acknowledged by the cluster
+    """
+
+    def __init__(self, ids=(), hashes=(), generation=0):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.generation = generation
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path=ES_SYNC_MANIFEST):
+        """
+        Load a manifest, an empty one if there's none yet
+        :param path
+        """
+
+        if not os.path.exists(path):
+            return cls()
+
+        data = np.load(path)
+        return cls(data['ids'], data['hashes'], int(data['generation']))
+
+    def save(self, path=ES_SYNC_MANIFEST):
+        """
+        Save the manifest, replacing the old one in one step
+        :param path
+        """
+
+        temp = path + '.tmp'
+        with open(temp, 'wb') as f:
+            np.savez(
+                f, ids=self.ids, hashes=self.hashes,
+                generation=self.generation
+            )
+
+        os.rename(temp, path)
+
+    def next_generation(self):
+        """
+        A generation above any used before. It's the time as
+        well, so it's also above the versions of documents
+        indexed without a manifest.
+        """
+
+        self.generation = max(self.generation + 1, int(time.time()))
+        return self.generation
+
+    def lookup(self, ids):
+        """
+        The hashes recorded for some ids
+        :param ids: int array
+        :return: (bool array of the ids recorded, their hashes)
+        """
+
+        if not len(self.ids):
+            return (
+                np.zeros(len(ids), dtype=bool),
+                np.zeros(len(ids), dtype=np.uint64)
+            )
+
+        positions = np.searchsorted(self.ids, ids)
+        positions = np.minimum(positions, len(self.ids) - 1)
+
+        found = self.ids[positions] == ids
+        return found, self.hashes[positions]
+
+    def update(self, ids, hashes, removed=()):
+        """
+        Record new hashes, and drop removed ids
+        :param ids: int array
+        :param hashes: uint64 array
+        :param removed: ids no longer in the index
+        """
+
+        keep = ~np.in1d(self.ids, np.concatenate([
+            np.asarray(ids, dtype=np.int64),
+            np.asarray(removed, dtype=np.int64)
+        ]))
+
+        all_ids = np.concatenate([self.ids[keep], ids])
+        all_hashes = np.concatenate([self.hashes[keep], hashes])
+
+        order = np.argsort(all_ids, kind='mergesort')
+        self.ids = all_ids[order]
+        self.hashes = all_hashes[order]
+
+
+def reset_manifest(path=ES_SYNC_MANIFEST):
+    """
+    Forget what was synced, for when the index is loaded anew
+    :param path
+    """
+
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def new_summary():
+    """
+    An empty sync summary
+    """
+
+    return {
+        'indexed': 0,
+        'skipped': 0,
+        'deleted': 0,
+        'stale': 0,
+        'failed': 0,
+        'retried': 0,
+        'errors': []
+    }
+
+
+def delete_chunk(ids, index, version):
+    """
+    A _bulk body deleting ids at an external version
+    :param ids
+    :param index
+    :param version
+    """
+
+    offsets = [0]
+    lines = []
+
+    for doc_id in ids:
+        lines.append(json.dumps({'delete': {
+            '_index': index, '_type': ES_DOC_TYPE, '_id': str(doc_id),
+            '_version': version, '_version_type': 'external'
+        }}) + '\n')
+        offsets.append(offsets[-1] + len(lines[-1]))
+
+    return BulkChunk(list(ids), offsets, ''.join(lines))
+
+
+def send(es, chunk, summary, max_retries, done=(200, 201)):
+    """
+    Send a chunk, adding to the summary
+    :return: the ids written, as a set
+    """
+
+    result = send_chunk(es, chunk, max_retries)
+    summary['retried'] += result['retried']
+
+    written = set(chunk.ids)
+    for error in result['errors']:
+        if error['status'] in done:
+            continue
+
+        written.discard(error['id'])
+
+        # A newer version is already in, ours is out of date
+        if error['status'] == 409:
+            summary['stale'] += 1
+        else:
+            summary['failed'] += 1
+            summary['errors'].append(error)
+
+    return written
+
+
+def rollup_sources(es, ids, index):
+    """
+    What the rollup counted some prospects as, before they change
+    :return: dict of id -> source, for the ids in the index
+    """
+
+    return dict(
+        (doc_id, source)
+        for doc_id, source in iter_prospects(
+            es, ids, index, include=list(ROLLUP_FIELDS)
+        )
+        if source is not None
+    )
+
+
+def sync_prospects(es, prospects, manifest, index=ES_INDEX, counts=None,
+                   delete_missing=True,
+                   chunk_size=ES_BULK_CHUNK_SIZE,
+                   max_chunk_bytes=ES_BULK_MAX_CHUNK_BYTES,
+                   max_retries=ES_BULK_MAX_RETRIES):
+    """
+    Send the prospects that changed since the last sync, and
+    delete those that are gone
+    :param es
+    :param prospects: iterable of Prospect, all of them
+    :param manifest: Manifest of the last sync, updated with
+        what's acknowledged
+    :param index
+    :param counts: Counter to add the rollup changes to
+    :param delete_missing: delete prospects in the manifest that
+        weren't generated, off when syncing only part of them
+    :param chunk_size: documents per request
+    :param max_chunk_bytes: max request body size
+    :param max_retries: times to resend rejected items
+    :return: dict of indexed, skipped, deleted, stale, failed and
+        retried counts, plus the per item errors
+    """
+
+    summary = new_summary()
+    generation = manifest.next_generation()
+
+    seen, removed = [], []
+    written_ids, written_hashes = [], []
+
+    try:
+        for batch in chunk_ids(prospects, chunk_size):
+            ids = np.array([prospect.id for prospect in batch], dtype=np.int64)
+            sources = [encode_prospect(prospect) for prospect in batch]
+            hashes = np.array([source_hash(s) for s in sources], dtype=np.uint64)
+
+            seen.append(ids)
+
+            recorded, old_hashes = manifest.lookup(ids)
+            changed = np.flatnonzero(~recorded | (old_hashes != hashes))
+            summary['skipped'] += len(batch) - len(changed)
+
+            if not len(changed):
+                continue
+
+            if counts is not None:
+                old = rollup_sources(es, ids[changed].tolist(), index)
+
+            written = set()
+            for chunk in chunk_sources(
+                ((batch[i].id, sources[i]) for i in changed),
+                index, chunk_size, max_chunk_bytes, version=generation
+            ):
+                written |= send(es, chunk, summary, max_retries)
+
+            summary['indexed'] += len(written)
+
+            for i in changed:
+                doc_id = batch[i].id
+                if doc_id not in written:
+                    continue
+
+                written_ids.append(ids[i])
+                written_hashes.append(hashes[i])
+
+                # Moved from the rollup it was counted in to its new one
+                if counts is not None:
+                    if doc_id in old:
+                        count_sources([old[doc_id]], counts, -1)
+                    count_sources([batch[i].__dict__], counts)
+
+        if delete_missing and len(manifest):
+            seen = np.concatenate(seen) if seen else np.zeros(0, dtype=np.int64)
+            missing = np.setdiff1d(manifest.ids, seen).tolist()
+
+            for ids in chunk_ids(missing, chunk_size):
+                if counts is not None:
+                    old = rollup_sources(es, ids, index)
+
+                # Already gone is as good as deleted
+                deleted = send(
+                    es, delete_chunk(ids, index, generation), summary,
+                    max_retries, done=(200, 404)
+                )
+
+                removed.extend(deleted)
+                summary['deleted'] += len(deleted)
+
+                if counts is not None:
+                    count_sources(
+                        [old[gone] for gone in deleted if gone in old],
+                        counts, -1
+                    )
+    finally:
+        # Keep what was acknowledged, even if the sync broke
+        manifest.update(
+            np.array(written_ids, dtype=np.int64),
+            np.array(written_hashes, dtype=np.uint64),
+            removed
+        )
+
+    return summary
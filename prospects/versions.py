@@ -0,0 +1,106 @@
+import re
+
+from prospects.mapping import create_index
+from prospects.settings import (
+    ES_INDEX, ES_KEEP_VERSIONS
+)
+
+
+def version_name(alias, version):
+    return '%s_v%d' % (alias, version)
+
+
+def index_versions(es, alias=ES_INDEX):
+    """
+    Get the versioned indices behind an alias, oldest first
+    :param es
+    :param alias
+    :return: list of (version, index name) tuples
+    """
+
+    response = es.indices.get_aliases(index='%s_v*' % alias, ignore=404)
+    pattern = re.compile(r'^%s_v(\d+)$' % re.escape(alias))
+
+    versions = []
+    for name in response:
+        match = pattern.match(name)
+        if match:
+            versions.append((int(match.group(1)), name))
+
+    return sorted(versions)
+
+
+def alias_indices(es, alias=ES_INDEX):
+    """
+    Get the indices an alias currently points at
+    :param es
+    :param alias
+    """
+
+    response = es.indices.get_alias(name=alias, ignore=404)
+    if 'status' in response or 'error' in response:
+        return []
+
+    return response.keys()
+
+
+def create_index_version(es, alias=ES_INDEX):
+    """
+    Create the next prospects_v<N> index, the alias and whatever
+    it points at are left alone
+    :param es
+    :param alias
+    :return: the new index name
+    """
+
+    versions = index_versions(es, alias)
+    latest = versions[-1][0] if versions else 0
+
+    index = version_name(alias, latest + 1)
+    create_index(es, index)
+
+    return index
+
+
+def swap_alias(es, index, alias=ES_INDEX):
+    """
+    Point the alias at the given index, in one atomic step
+    :param es
+    :param index
+    :param alias
+    """
+
+    current = alias_indices(es, alias)
+
+    # A plain index from before aliases were used holds the
+    # name, it has to go before the alias can take it
+    if not current and es.indices.exists(index=alias):
+        es.indices.delete(index=alias)
+
+    actions = [
+        {'remove': {'index': name, 'alias': alias}}
+        for name in current if name != index
+    ]
+    actions.append({'add': {'index': index, 'alias': alias}})
+
+    return es.indices.update_aliases(body={'actions': actions})
+
+
+def delete_old_versions(es, alias=ES_INDEX, keep=ES_KEEP_VERSIONS):
+    """
+    Delete versioned indices, apart from the ones the alias points
+    at and the newest few of the rest
+    :param es
+    :param alias
+    :param keep: number of old versions to keep
+    :return: the deleted index names
+    """
+
+    live = set(alias_indices(es, alias))
+    old = [name for _, name in index_versions(es, alias) if name not in live]
+
+    deleted = old[:max(len(old) - keep, 0)]
+    for name in deleted:
+        es.indices.delete(index=name)
+
+    return deleted
@@ -0,0 +1,342 @@
+import time
+from collections import Counter
+
+from prospects.bulk import send_chunk
+from prospects.lookup import get_prospects
+from prospects.rollup import ROLLUP_FIELDS, apply_counts, rollup_key
+from prospects import serializer
+from prospects.serializer import BulkChunk
+from prospects.settings import (
+    ES_INDEX, ES_DOC_TYPE, ES_ROLLUP_INDEX,
+    ES_BULK_CHUNK_SIZE, ES_BULK_MAX_CHUNK_BYTES, ES_BULK_MAX_RETRIES,
+    ES_WRITER_FLUSH_INTERVAL
+)
+
+
+# ES 1.x has no refresh=wait_for, so instead of refreshing per
+# write the index is refreshed once, when the writer is closed.
+#
+# The rollup counts are kept in step with each request: before it's
+# sent the rolled up fields of the prospects it deletes or changes
+# are read, and once it's answered the counts of the operations that
+# went through are moved.
+
+# Summary count of each action that went through
+COUNTS = {
+    'create': 'created',
+    'update': 'updated',
+    'delete': 'deleted',
+}
+
+
+def new_summary():
+    """
+    An empty writer summary
+    """
+
+    return {
+        'created': 0,
+        'updated': 0,
+        'deleted': 0,
+        'not_found': 0,
+        'failed': 0,
+        'retried': 0,
+        'conflicts': [],
+        'errors': []
+    }
+
+
+class ProspectWriter(object):
+    """
+    Buffer creates, updates and deletes, and send them with _bulk
+
+        with ProspectWriter(es) as writer:
+            for id in ids:
+                writer.update(id, {'assigned_to': 'Kris Neuharth'})
+
+        writer.summary['updated'], writer.summary['conflicts']
+
+    The buffer is sent once it holds max_actions operations, before
+    an operation that would take it past max_bytes of request body
+    is added, or when an operation comes in more than flush_interval
+    seconds after the oldest one buffered. Whatever is left is sent
+    on close.
+
+    There's no timer: flush_interval is only checked as operations
+    are added, so a writer that stops getting them holds what it
+    has until the next flush() or close().
+
+    Counts in the rollup index are updated as each request is
+    answered. Pass rollup=None when writing somewhere that isn't
+    rolled up.
+    """
+
+    def __init__(self, es, index=ES_INDEX,
+                 max_actions=ES_BULK_CHUNK_SIZE,
+                 max_bytes=ES_BULK_MAX_CHUNK_BYTES,
+                 flush_interval=ES_WRITER_FLUSH_INTERVAL,
+                 max_retries=ES_BULK_MAX_RETRIES,
+                 refresh=True, on_result=None, rollup=ES_ROLLUP_INDEX):
+        """
+        :param es
+        :param index
+        :param max_actions: operations per request
+        :param max_bytes: request body size
+        :param flush_interval: seconds an operation may wait
+        :param max_retries: times to resend rejected operations
+        :param refresh: refresh the index once on close
+        :param on_result: called with the action, id, status and
+            bulk item of every operation once it's done
+        :param rollup: rollup index to keep the counts of, None
+            to leave the counts alone
+        """
+
+        self.es = es
+        self.index = index
+        self.max_actions = max_actions
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.refresh = refresh
+        self.on_result = on_result
+        self.rollup = rollup
+
+        self.summary = new_summary()
+        self.written = False
+        self.counted = False
+        self.reset()
+
+    def reset(self):
+        self.ops = []
+        self.offsets = [0]
+        self.parts = []
+        self.oldest = None
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, action, doc_id, meta=None, source=None):
+        """
+        Buffer one operation
+        :param action: create, update or delete
+        :param doc_id
+        :param meta: extra action line fields
+        :param source: the source line, if the action has one
+        """
+
+        header = {'_index': self.index, '_type': ES_DOC_TYPE, '_id': doc_id}
+        header.update(meta or {})
+
+        lines = serializer.dumps({action: header}) + '\n'
+        if source is not None:
+            lines += serializer.dumps(source) + '\n'
+
+        # Send what's buffered first if this wouldn't fit with it
+        if self.ops and self.offsets[-1] + len(lines) > self.max_bytes:
+            self.flush()
+
+        self.ops.append((action, doc_id, source))
+        self.parts.append(lines)
+        self.offsets.append(self.offsets[-1] + len(lines))
+
+        now = time.time()
+        if self.oldest is None:
+            self.oldest = now
+
+        if (len(self.ops) >= self.max_actions or
+                self.offsets[-1] >= self.max_bytes or
+                now - self.oldest >= self.flush_interval):
+            self.flush()
+
+    def create(self, doc_id, source):
+        """
+        Create a prospect, a conflict if it already exists
+        :param doc_id
+        :param source: dict
+        """
+
+        self.add('create', doc_id, source=source)
+
+    def update(self, doc_id, doc=None, upsert=None, doc_as_upsert=False,
+               retry_on_conflict=None):
+        """
+        Change some fields of a prospect
+        :param doc_id
+        :param doc: the fields to change
+        :param upsert: source to create it with, if it doesn't exist
+        :param doc_as_upsert: create it from doc if it doesn't exist
+        :param retry_on_conflict: times to retry if it changes meanwhile
+        """
+
+        body = {'doc': doc or {}}
+        if upsert is not None:
+            body['upsert'] = upsert
+        if doc_as_upsert:
+            body['doc_as_upsert'] = True
+
+        meta = {}
+        if retry_on_conflict:
+            meta['_retry_on_conflict'] = retry_on_conflict
+
+        self.add('update', doc_id, meta, body)
+
+    def delete(self, doc_id, version=None):
+        """
+        Delete a prospect
+        :param doc_id
+        :param version: only if it's still at this version
+        """
+
+        meta = {}
+        if version is not None:
+            meta['_version'] = version
+
+        self.add('delete', doc_id, meta)
+
+    def flush(self):
+        """
+        Send the buffered operations
+        :return: summary of those operations
+        """
+
+        if not self.ops:
+            return new_summary()
+
+        chunk = BulkChunk(self.ops, self.offsets, ''.join(self.parts))
+        self.reset()
+
+        counts = None
+        if self.rollup:
+            counts = Counter()
+
+        summary = self.send(chunk, counts)
+        self.written = True
+
+        if counts:
+            apply_counts(self.es, counts, self.rollup)
+            self.counted = True
+
+        for key, value in summary.items():
+            self.summary[key] += value
+
+        return summary
+
+    def send(self, chunk, counts=None):
+        """
+        Send one chunk with send_chunk, counting each
+        operation by its action and result
+        :param chunk: BulkChunk of (action, id, source line) tuples
+        :param counts: Counter to add the rollup changes to
+        :return: summary dict
+        """
+
+        summary = new_summary()
+
+        if counts is not None:
+            # Rolled up fields of the prospects as they are now
+            current, _ = get_prospects(
+                self.es,
+                set(doc_id for action, doc_id, body in chunk.ids
+                    if rolled_up(action, body)),
+                self.index,
+                include=list(ROLLUP_FIELDS)
+            )
+
+        def on_item(op, status, result):
+            action, doc_id, body = op
+
+            if status < 300:
+                summary[COUNTS[action]] += 1
+
+                if counts is not None and rolled_up(action, body):
+                    move_count(counts, current, action, doc_id, body)
+            elif status == 404 and action == 'delete':
+                summary['not_found'] += 1
+            else:
+                summary['failed'] += 1
+                summary['errors'].append({
+                    'id': doc_id,
+                    'action': action,
+                    'status': status,
+                    'error': result.get('error')
+                })
+
+                if status == 409:
+                    summary['conflicts'].append(doc_id)
+
+            if self.on_result:
+                self.on_result(action, doc_id, status, result)
+
+        result = send_chunk(self.es, chunk, self.max_retries, on_item)
+        summary['retried'] = result['retried']
+
+        return summary
+
+    def close(self):
+        """
+        Send what's left, then refresh the index once
+        """
+
+        self.flush()
+
+        if self.refresh and self.written:
+            self.es.indices.refresh(index=self.index)
+            self.written = False
+
+        if self.refresh and self.counted:
+            self.es.indices.refresh(index=self.rollup)
+            self.counted = False
+
+
+def rolled_up(action, body):
+    """
+    Whether an operation can change the rollup counts
+    :param action: create, update or delete
+    :param body: its source line, a dict
+    """
+
+    if action != 'update':
+        return True
+
+    if 'upsert' in body or body.get('doc_as_upsert'):
+        return True
+
+    return any(field in body['doc'] for field in ROLLUP_FIELDS)
+
+
+def move_count(counts, current, action, doc_id, body):
+    """
+    Move a prospect between rollups for an operation that
+    went through
+    :param counts: Counter to add the changes to
+    :param current: dict of id -> rolled up fields, kept up to
+        date as operations go through
+    :param action
+    :param doc_id
+    :param body: the operation's source line, a dict
+    """
+
+    old = current.get(doc_id)
+
+    if action == 'create':
+        new = body
+    elif action == 'delete':
+        new = None
+    elif old is not None:
+        new = dict(old, **body['doc'])
+    else:
+        # Created by the update
+        new = body.get('upsert', body['doc'])
+
+    if old is not None:
+        counts[rollup_key(old)] -= 1
+    if new is not None:
+        counts[rollup_key(new)] += 1
+
+    current[doc_id] = new